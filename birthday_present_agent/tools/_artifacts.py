@@ -0,0 +1,24 @@
+"""Background artifact logging shared by the agent tools."""
+
+from __future__ import annotations
+
+import asyncio
+
+from google.adk.tools import ToolContext
+from google.genai import types
+
+
+async def _safe_save_artifact(tool_context: ToolContext, name: str, text: str) -> None:
+    try:
+        await tool_context.save_artifact(name=name, artifact=types.Part.from_text(text))
+    except Exception:
+        # Artifact logging failures must not break the tool chain.
+        pass
+
+
+def save_artifact_in_background(tool_context: ToolContext, name: str, text: str) -> None:
+    """Schedule an artifact save without blocking the tool's return path."""
+
+    task = asyncio.create_task(_safe_save_artifact(tool_context, name, text))
+    # Retrieve the (always-swallowed) exception so the loop never warns.
+    task.add_done_callback(lambda finished: finished.exception())
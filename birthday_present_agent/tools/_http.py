@@ -0,0 +1,105 @@
+"""Shared HTTP session, retry loop, and response cache for the SerpApi tools."""
+
+from __future__ import annotations
+
+import asyncio
+import atexit
+import os
+import random
+import threading
+import weakref
+from typing import Any, Awaitable, Callable, Dict
+
+import httpx
+from cachetools import TTLCache
+
+# The tools run on more than one event loop: the Streamlit front-end drives
+# the agent with one loop per browser session while sharing the runner
+# process-wide. A single global client would hand connections created on one
+# loop to another and fail with "attached to a different loop", so clients
+# (and the batch semaphore) are keyed by the loop they were created on.
+_CLIENTS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+_SEMAPHORES: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+_CONCURRENCY = int(os.getenv("SERPAPI_CONCURRENCY", "8"))
+
+
+async def get_client() -> httpx.AsyncClient:
+    """Return the AsyncClient bound to the running loop, creating it lazily."""
+
+    loop = asyncio.get_running_loop()
+    client = _CLIENTS.get(loop)
+    if client is None:
+        # No await between the miss and the store, so coroutines on the same
+        # loop cannot race here.
+        client = httpx.AsyncClient(
+            timeout=30,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=30),
+            http2=True,
+        )
+        _CLIENTS[loop] = client
+    return client
+
+
+def get_semaphore() -> asyncio.Semaphore:
+    """Return the SerpApi concurrency semaphore for the running loop."""
+
+    loop = asyncio.get_running_loop()
+    semaphore = _SEMAPHORES.get(loop)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(_CONCURRENCY)
+        _SEMAPHORES[loop] = semaphore
+    return semaphore
+
+
+async def retry(
+    coro_factory: Callable[[], Awaitable[Dict[str, Any]]],
+    tries: int = 3,
+    base: float = 0.1,
+    cap: float = 2.0,
+) -> Dict[str, Any]:
+    """Run ``coro_factory`` with jittered exponential backoff on HTTP errors."""
+
+    for attempt in range(tries):
+        try:
+            return await coro_factory()
+        except httpx.HTTPError:
+            if attempt == tries - 1:
+                raise
+            await asyncio.sleep(min(cap, base * 2**attempt) * random.uniform(0.5, 1.5))
+    raise RuntimeError("Unreachable")
+
+
+# SerpApi payloads are stable for minutes at a time; cache them in-process.
+# Set SERPAPI_CACHE_TTL=0 to disable. The cache is shared across event loops,
+# so it is guarded by a thread lock rather than an asyncio one.
+_CACHE_TTL = int(os.getenv("SERPAPI_CACHE_TTL", "300"))
+_CACHE: TTLCache = TTLCache(maxsize=512, ttl=_CACHE_TTL or 1)
+_CACHE_LOCK = threading.Lock()
+
+
+async def cached_call(key: Any, coro_factory: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+    """Return the cached payload for ``key``, fetching it with ``retry`` on a miss."""
+
+    if not _CACHE_TTL:
+        return await retry(coro_factory)
+
+    with _CACHE_LOCK:
+        cached = _CACHE.get(key)
+    if cached is not None:
+        return cached
+
+    raw = await retry(coro_factory)
+
+    with _CACHE_LOCK:
+        _CACHE[key] = raw
+    return raw
+
+
+@atexit.register
+def _close_clients() -> None:
+    for client in list(_CLIENTS.values()):
+        try:
+            asyncio.run(client.aclose())
+        except RuntimeError:
+            pass
@@ -2,17 +2,35 @@
 
 from __future__ import annotations
 
-import json
+import asyncio
 import os
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional
 
 import httpx
+import orjson
 from google.adk.tools import ToolContext
-from google.genai import types
-from tenacity import AsyncRetrying, RetryError, stop_after_attempt, wait_exponential
+
+from ._artifacts import save_artifact_in_background
+from ._http import cached_call, get_client, get_semaphore
 
 PRODUCT_ENDPOINT = os.getenv("SERPAPI_PRODUCT_ENDPOINT", "https://serpapi.com/search.json")
 
+# Payloads above this size get projected down to the subtrees
+# _format_response actually reads before they are cached.
+_PRUNE_THRESHOLD = 200_000
+
+
+def _prune_raw(raw: Dict[str, Any]) -> Dict[str, Any]:
+    """Keep only the parts of a large product payload we surface."""
+
+    pruned: Dict[str, Any] = {"product_results": raw.get("product_results") or {}}
+    sellers = raw.get("sellers_results")
+    if isinstance(sellers, dict):
+        pruned["sellers_results"] = {"online_sellers": sellers.get("online_sellers", [])}
+    metadata = raw.get("search_metadata")
+    if isinstance(metadata, dict) and metadata.get("google_product_url"):
+        pruned["search_metadata"] = {"google_product_url": metadata["google_product_url"]}
+    return pruned
 
 async def _request(params: Dict[str, Any], url_override: Optional[str] = None) -> Dict[str, Any]:
     request_kwargs: Dict[str, Any] = {}
@@ -22,15 +40,21 @@ async def _request(params: Dict[str, Any], url_override: Optional[str] = None) -
         request_kwargs["url"] = PRODUCT_ENDPOINT
         request_kwargs["params"] = params
 
-    async for attempt in AsyncRetrying(
-        stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=1, max=6)
-    ):
-        with attempt:
-            async with httpx.AsyncClient(timeout=30) as client:
-                response = await client.get(**request_kwargs)
-                response.raise_for_status()
-                return response.json()
-    raise RuntimeError("Unreachable")
+    async def _once() -> Dict[str, Any]:
+        client = await get_client()
+        response = await client.get(**request_kwargs)
+        response.raise_for_status()
+        content = await response.aread()
+        raw = orjson.loads(content)
+        if len(content) > _PRUNE_THRESHOLD:
+            return _prune_raw(raw)
+        return raw
+
+    if url_override:
+        key: Any = ("product", url_override)
+    else:
+        key = ("product", tuple(sorted((k, v) for k, v in params.items() if k != "api_key")))
+    return await cached_call(key, _once)
 
 
 def _format_response(raw: Dict[str, Any]) -> Dict[str, Any]:
@@ -38,34 +62,23 @@ def _format_response(raw: Dict[str, Any]) -> Dict[str, Any]:
     sellers = raw.get("sellers_results", {})
     online = sellers.get("online_sellers", []) if isinstance(sellers, dict) else []
 
-    formatted: Dict[str, Any] = {
-        "title": product.get("title"),
-        "description": product.get("description"),
-        "prices": product.get("prices"),
-        "conditions": product.get("conditions"),
-        "extensions": product.get("extensions"),
-        "media": product.get("media"),
-        "product_id": product.get("product_id"),
-        "product_link": product.get("product_link") or raw.get("search_metadata", {}).get("google_product_url"),
-        "sellers": online,
-    }
-    # Remove None entries for readability
-    return {k: v for k, v in formatted.items() if v}
-
-
-async def fetch_product_details(product_reference: str, tool_context: ToolContext) -> str:
-    """Retrieve a rich product record for a SerpApi Google Shopping item.
+    # Build the projection in one pass, skipping empty values for readability
+    fields = (
+        ("title", product.get("title")),
+        ("description", product.get("description")),
+        ("prices", product.get("prices")),
+        ("conditions", product.get("conditions")),
+        ("extensions", product.get("extensions")),
+        ("media", product.get("media")),
+        ("product_id", product.get("product_id")),
+        ("product_link", product.get("product_link") or raw.get("search_metadata", {}).get("google_product_url")),
+        ("sellers", online),
+    )
+    return {key: value for key, value in fields if value}
 
-    Args:
-        product_reference: `serpapi_product_api` URL、商品の `product_id`、または `product_id:<ID>` 形式の文字列。
-        tool_context: ADKツール実行コンテキスト。
 
-    Returns:
-        JSON文字列。商品概要と販売情報を含む。
-    """
-    api_key = os.getenv("SERPAPI_API_KEY")
-    if not api_key:
-        raise RuntimeError("SERPAPI_API_KEY is not set. Add it to your .env file.")
+async def _fetch_one(product_reference: str, api_key: str) -> Dict[str, Any]:
+    """Fetch and format a single product record."""
 
     product_reference = product_reference.strip()
     params: Dict[str, Any] = {
@@ -86,20 +99,70 @@ async def fetch_product_details(product_reference: str, tool_context: ToolContex
 
     try:
         raw = await _request(params, url_override=url_override)
-    except RetryError as error:
-        raise RuntimeError(f"SerpApi product lookup failed after retries: {error}") from error
     except httpx.HTTPError as error:
         raise RuntimeError(f"SerpApi product lookup failed: {error}") from error
 
-    formatted = _format_response(raw)
-    payload = json.dumps(formatted, ensure_ascii=False, indent=2)
+    return _format_response(raw)
 
-    try:
-        await tool_context.save_artifact(
-            name="product_details",
-            artifact=types.Part.from_text(payload),
-        )
-    except Exception:
-        pass
-
-    return payload
+
+async def fetch_product_details(product_reference: str, tool_context: ToolContext) -> Dict[str, Any]:
+    """Retrieve a rich product record for a SerpApi Google Shopping item.
+
+    Args:
+        product_reference: `serpapi_product_api` URL、商品の `product_id`、または `product_id:<ID>` 形式の文字列。
+        tool_context: ADKツール実行コンテキスト。
+
+    Returns:
+        辞書オブジェクト。商品概要と販売情報を含む。
+    """
+    api_key = os.getenv("SERPAPI_API_KEY")
+    if not api_key:
+        raise RuntimeError("SERPAPI_API_KEY is not set. Add it to your .env file.")
+
+    formatted = await _fetch_one(product_reference, api_key)
+
+    save_artifact_in_background(
+        tool_context,
+        "product_details",
+        orjson.dumps(formatted, option=orjson.OPT_INDENT_2).decode(),
+    )
+
+    return formatted
+
+
+async def fetch_product_details_batch(product_references: List[str], tool_context: ToolContext) -> Dict[str, Any]:
+    """Retrieve product records for several Google Shopping items at once.
+
+    Args:
+        product_references: `serpapi_product_api` URLまたは `product_id` のリスト。
+        tool_context: ADKツール実行コンテキスト。
+
+    Returns:
+        辞書オブジェクト。入力順に並んだ商品概要のリストを含む。
+    """
+    api_key = os.getenv("SERPAPI_API_KEY")
+    if not api_key:
+        raise RuntimeError("SERPAPI_API_KEY is not set. Add it to your .env file.")
+
+    async def _guarded(reference: str) -> Dict[str, Any]:
+        async with get_semaphore():
+            return await _fetch_one(reference, api_key)
+
+    results = await asyncio.gather(*(_guarded(reference) for reference in product_references), return_exceptions=True)
+
+    records: List[Dict[str, Any]] = []
+    for reference, result in zip(product_references, results):
+        if isinstance(result, BaseException):
+            records.append({"product_reference": reference, "error": str(result)})
+        else:
+            records.append(result)
+
+    summary = {"results": records}
+
+    save_artifact_in_background(
+        tool_context,
+        "product_details_batch",
+        orjson.dumps(summary, option=orjson.OPT_INDENT_2).decode(),
+    )
+
+    return summary
@@ -2,47 +2,46 @@
 
 from __future__ import annotations
 
-import json
 import os
 from typing import Any, Dict, List
 
 import httpx
+import orjson
 from google.adk.tools import ToolContext
-from google.genai import types
-from tenacity import AsyncRetrying, RetryError, stop_after_attempt, wait_exponential
+
+from ._artifacts import save_artifact_in_background
+from ._http import cached_call, get_client
 
 SHOPPING_ENDPOINT = os.getenv("SERPAPI_SHOPPING_ENDPOINT", "https://serpapi.com/search.json")
 
 
 async def _call_serpapi(params: Dict[str, Any]) -> Dict[str, Any]:
-    async for attempt in AsyncRetrying(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=1, max=6)):
-        with attempt:
-            async with httpx.AsyncClient(timeout=30) as client:
-                response = await client.get(SHOPPING_ENDPOINT, params=params)
-                response.raise_for_status()
-                return response.json()
-    raise RuntimeError("Unreachable")
+    async def _once() -> Dict[str, Any]:
+        client = await get_client()
+        response = await client.get(SHOPPING_ENDPOINT, params=params)
+        response.raise_for_status()
+        return orjson.loads(await response.aread())
+
+    key = ("shopping", tuple(sorted((k, v) for k, v in params.items() if k != "api_key")))
+    return await cached_call(key, _once)
 
 
 def _summarize_results(raw: Dict[str, Any]) -> Dict[str, Any]:
     results: List[Dict[str, Any]] = []
     for item in raw.get("shopping_results", [])[:10]:
-        entry = {
-            "position": item.get("position"),
-            "title": item.get("title"),
-            "price": item.get("price") or item.get("extracted_price"),
-            "extracted_price": item.get("extracted_price"),
-            "source": item.get("source"),
-            "product_link": item.get("product_link"),
-            "thumbnail": item.get("thumbnail") or item.get("serpapi_thumbnail"),
-            "serpapi_product_api": item.get("serpapi_product_api"),
-            # "serpapi_immersive_product_api": item.get("serpapi_immersive_product_api"),
-            "description": item.get("excerpt") or item.get("description"),
-            "shipping": item.get("delivery"),
-        }
-        # Remove None values for readability
-        entry = {k: v for k, v in entry.items() if v}
-        results.append(entry)
+        # Build each entry in one pass, skipping empty values for readability
+        fields = (
+            ("position", item.get("position")),
+            ("title", item.get("title")),
+            ("price", item.get("price") or item.get("extracted_price")),
+            ("source", item.get("source")),
+            ("product_link", item.get("product_link")),
+            ("thumbnail", item.get("thumbnail") or item.get("serpapi_thumbnail")),
+            ("serpapi_product_api", item.get("serpapi_product_api")),
+            ("description", item.get("excerpt") or item.get("description")),
+            ("shipping", item.get("delivery")),
+        )
+        results.append({key: value for key, value in fields if value})
     return {
         "results": results,
         "raw_metadata": {"total_results": raw.get("search_information", {}).get("total_results")},
@@ -74,20 +73,15 @@ async def shopping_search(query: str, tool_context: ToolContext) -> Dict[str, An
 
     try:
         raw = await _call_serpapi(params)
-    except RetryError as error:
-        raise RuntimeError(f"SerpApi request failed after retries: {error}") from error
     except httpx.HTTPError as error:
         raise RuntimeError(f"SerpApi request failed: {error}") from error
 
     summary = {"query": query, **_summarize_results(raw)}
 
-    try:
-        await tool_context.save_artifact(
-            name="shopping_results",
-            artifact=types.Part.from_text(json.dumps(summary, ensure_ascii=False, indent=2)),
-        )
-    except Exception:
-        # Artifact logging failures must not break the tool chain.
-        pass
+    save_artifact_in_background(
+        tool_context,
+        "shopping_results",
+        orjson.dumps(summary, option=orjson.OPT_INDENT_2).decode(),
+    )
 
     return summary
@@ -4,20 +4,36 @@ from __future__ import annotations
 
 import re
 from typing import Optional
-from urllib.parse import quote_plus
+from urllib.parse import urlencode
 
 from google.adk.tools import ToolContext
-from google.genai import types
+
+from ._artifacts import save_artifact_in_background
+
+_HANDLE_RE = re.compile(r"(?:x|twitter)\.com/([^/?#]+)")
+
+_GROK_URL_PREFIX = "https://grok.com/?"
+
+_PROMPT_TMPL = (
+    "{profile_url} の投稿やプロフィールを元に、趣味・好きなもの・興味のあるもの・欲しているものなどを推測し、簡潔に回答してください"
+)
+
+_INSTRUCTIONS_TMPL = (
+    "ユーザーには次のメッセージを表示し、手動での確認を促してください。\n"
+    "X API の制限を回避するため、手動で確認してください。\n"
+    "1. [Grokを開く]({grok_url}) をタップして、プロンプトが入力された状態の Grok チャットにアクセスします。\n"
+    "2. Grok の回答内容をコピーします。\n"
+    "3. このエージェントにペーストして共有してください。"
+)
 
 
 def _extract_handle(x_url: str) -> Optional[str]:
     """Return the X handle (without @) if present in the URL."""
 
-    match = re.search(r"(?:x|twitter)\.com/([^/?#]+)", x_url)
+    match = _HANDLE_RE.search(x_url)
     if not match:
         return None
-    handle = match.group(1)
-    handle = handle.strip("@")
+    handle = match.group(1).strip("@")
     if handle:
         return handle
     return None
@@ -28,23 +44,11 @@ async def fetch_social_profile(x_url: str, tool_context: ToolContext) -> str:
 
     handle = _extract_handle(x_url)
     profile_url = f"https://x.com/{handle}" if handle else x_url
-    prompt = f"{profile_url} の投稿やプロフィールを元に、趣味・好きなもの・興味のあるもの・欲しているものなどを推測し、簡潔に回答してください"
-    grok_url = f"https://grok.com/?q={quote_plus(prompt)}"
-
-    instructions = (
-        "ユーザーには次のメッセージを表示し、手動での確認を促してください。\n"
-        "X API の制限を回避するため、手動で確認してください。\n"
-        f"1. [Grokを開く]({grok_url}) をタップして、プロンプトが入力された状態の Grok チャットにアクセスします。\n"
-        "2. Grok の回答内容をコピーします。\n"
-        "3. このエージェントにペーストして共有してください。"
-    )
-
-    try:
-        await tool_context.save_artifact(
-            name="grok_manual_prompt",
-            artifact=types.Part.from_text(prompt),
-        )
-    except Exception:
-        pass
+    prompt = _PROMPT_TMPL.format(profile_url=profile_url)
+    grok_url = _GROK_URL_PREFIX + urlencode({"q": prompt})
+
+    instructions = _INSTRUCTIONS_TMPL.format(grok_url=grok_url)
+
+    save_artifact_in_background(tool_context, "grok_manual_prompt", prompt)
 
     return instructions
@@ -2,21 +2,56 @@
 
 from __future__ import annotations
 
+import functools
 import json
 import os
+import queue
 import re
+import threading
 import uuid
 import warnings
-from html import escape
+from collections import deque
+from dataclasses import asdict, dataclass
 from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
 
+try:
+    from markupsafe import escape  # C-accelerated; ships with Streamlit
+except ImportError:
+    from html import escape
+
+# One-pass C-level escape for hot per-rerun call sites.
+_HTML_ESCAPE_TABLE = str.maketrans({"&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;", "'": "&#x27;"})
+
+
+def _esc(value: str) -> str:
+    return value.translate(_HTML_ESCAPE_TABLE)
+
 import requests
 import streamlit as st
+from requests.adapters import HTTPAdapter, Retry
 import streamlit.components.v1 as components
 import vertexai
 from google.oauth2 import service_account
 from vertexai import agent_engines
 
+try:
+    import orjson
+
+    def _dumps(payload: Any) -> str:
+        return orjson.dumps(payload, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS).decode()
+
+    def _loads(data: bytes) -> Any:
+        return orjson.loads(data)
+
+except ImportError:
+
+    def _dumps(payload: Any) -> str:
+        return json.dumps(payload, ensure_ascii=False, indent=2)
+
+    def _loads(data: bytes) -> Any:
+        return json.loads(data)
+
+
 # Pydantic の警告を抑制
 warnings.filterwarnings("ignore", message="Field name .* shadows an attribute in parent")
 # aiohttp の警告を抑制
@@ -46,43 +81,76 @@ _SA_OPTIONAL_ENV_VARS: Dict[str, str] = {
     "universe_domain": "VERTEXAI_SERVICE_ACCOUNT_UNIVERSE_DOMAIN",
 }
 
+_SA_ENV_PAIRS: Tuple[Tuple[str, str], ...] = tuple(_SA_REQUIRED_ENV_VARS.items())
+
+# Tool-log payloads beyond this size are truncated for display only; the
+# stored payload stays intact for query extraction.
+_MAX_LOG_PAYLOAD_CHARS = 8192
+
+_SECTION_HEADING_RE = re.compile(r"(^|\n)###\s+", re.MULTILINE)
+_INIT_SKIP_RE = re.compile(r"エラー|SERPAPI")
+
+# One pass over the agent text: the C regex engine tokenizes every line and
+# Python only dispatches on which alternative matched.
+_LINE_RE = re.compile(
+    r"^(?:"
+    r"(?P<section>[ \t]*###[ \t]+(?P<s_title>.*?))"
+    r"|(?P<item>[ \t]*(?P<i_num>\d+)\.[ \t]*(?P<i_title>.*?))"
+    r"|(?P<field>[ \t]*-[ \t]*(?P<f_label>[^:：]+)[：:]+[ \t]*(?P<f_val>.*?))"
+    r"|(?P<text>[ \t]*\S.*?)"
+    r")[ \t]*$",
+    re.MULTILINE,
+)
+_FENCED_JSON_RE = re.compile(r"```(?:json)?\s*(.*?)\s*(?:```)?\s*\Z", re.IGNORECASE | re.DOTALL)
+
 if not AGENT_ENGINE_ID:
     raise RuntimeError("VERTEX_AI_AGENT_ENGINE_ID must be set for Agent Engine access.")
 
 if not VERTEX_PROJECT or not VERTEX_LOCATION:
     raise RuntimeError("GOOGLE_CLOUD_PROJECT and GOOGLE_CLOUD_LOCATION must be configured.")
 
-vertex_kwargs: Dict[str, Any] = {
-    "project": VERTEX_PROJECT,
-    "location": VERTEX_LOCATION,
-}
+@dataclass(frozen=True)
+class _SAConfig:
+    """Service-account fields read from the environment, built once per process."""
+
+    type: str
+    project_id: str
+    private_key_id: str
+    private_key: str
+    client_email: str
+    client_id: str
+    auth_uri: str
+    token_uri: str
+    auth_provider_x509_cert_url: str
+    client_x509_cert_url: str
+    universe_domain: Optional[str] = None
+
+
+@functools.lru_cache(maxsize=1)
+def _sa_config() -> Optional[_SAConfig]:
+    values = {field: os.getenv(env_name) for field, env_name in _SA_ENV_PAIRS}
+    if not any(values.values()):
+        return None
 
+    missing_env_vars = [env_name for field, env_name in _SA_ENV_PAIRS if not values[field]]
+    if missing_env_vars:
+        missing_str = ", ".join(missing_env_vars)
+        raise RuntimeError(f"Missing Vertex AI service account environment variables: {missing_str}.")
 
-def _build_service_account_credentials() -> Optional[service_account.Credentials]:
-    service_account_info: Dict[str, str] = {}
-    missing_env_vars: List[str] = []
-    any_env_values = False
+    values["private_key"] = values["private_key"].replace("\\n", "\n")
 
-    for field, env_name in _SA_REQUIRED_ENV_VARS.items():
+    for field, env_name in _SA_OPTIONAL_ENV_VARS.items():
         value = os.getenv(env_name)
         if value:
-            service_account_info[field] = value
-            any_env_values = True
-        else:
-            missing_env_vars.append(env_name)
-
-    if any_env_values:
-        if missing_env_vars:
-            missing_str = ", ".join(missing_env_vars)
-            raise RuntimeError(f"Missing Vertex AI service account environment variables: {missing_str}.")
+            values[field] = value
 
-        service_account_info["private_key"] = service_account_info["private_key"].replace("\\n", "\n")
+    return _SAConfig(**values)
 
-        for field, env_name in _SA_OPTIONAL_ENV_VARS.items():
-            value = os.getenv(env_name)
-            if value:
-                service_account_info[field] = value
 
+def _build_service_account_credentials() -> Optional[service_account.Credentials]:
+    config = _sa_config()
+    if config is not None:
+        service_account_info = {field: value for field, value in asdict(config).items() if value is not None}
         return service_account.Credentials.from_service_account_info(service_account_info)
 
     if GOOGLE_APPLICATION_CREDENTIALS:
@@ -91,18 +159,22 @@ def _build_service_account_credentials() -> Optional[service_account.Credentials
     return None
 
 
-credentials = _build_service_account_credentials()
-if credentials:
-    vertex_kwargs["credentials"] = credentials
+@st.cache_resource(show_spinner=False)
+def _get_remote_app() -> Any:
+    """Initialize Vertex AI once per process and return the remote agent."""
+    vertex_kwargs: Dict[str, Any] = {
+        "project": VERTEX_PROJECT,
+        "location": VERTEX_LOCATION,
+    }
+    credentials = _build_service_account_credentials()
+    if credentials:
+        vertex_kwargs["credentials"] = credentials
 
-vertexai.init(**vertex_kwargs)
-remote_app = agent_engines.get(AGENT_ENGINE_ID)
+    vertexai.init(**vertex_kwargs)
+    return agent_engines.get(AGENT_ENGINE_ID)
 
 
-def _inject_custom_styles() -> None:
-    """Inject CSS styles for custom card layout."""
-    st.markdown(
-        """
+_CUSTOM_CSS = """
         <style>
         :root {
             --primary-color: #518378;
@@ -158,6 +230,14 @@ def _inject_custom_styles() -> None:
             background: rgba(81, 131, 120, 0.35);
             border-radius: 999px;
         }
+        .card-grid {
+            display: grid;
+            grid-template-columns: repeat(3, 1fr);
+            gap: 12px;
+            align-items: start;
+            padding-top: 12px;
+            margin-bottom: 12px;
+        }
         .product-card {
             width: 100%;
             border-radius: 18px;
@@ -265,9 +345,15 @@ def _inject_custom_styles() -> None:
             object-fit: contain;
         }
         </style>
-        """,
-        unsafe_allow_html=True,
-    )
+        """
+
+# Collapse whitespace once at import so each rerun ships a small payload.
+_CUSTOM_CSS_MIN = re.sub(r"\s+", " ", _CUSTOM_CSS).strip()
+
+
+def _inject_custom_styles() -> None:
+    """Inject CSS styles for custom card layout."""
+    st.markdown(_CUSTOM_CSS_MIN, unsafe_allow_html=True)
 
 
 def _get_field(obj: Any, name: str, default: Any = None) -> Any:
@@ -276,13 +362,52 @@ def _get_field(obj: Any, name: str, default: Any = None) -> Any:
     return getattr(obj, name, default)
 
 
+def _fast_parts(event: Dict[str, Any]) -> Iterable[Any]:
+    """Part iteration for dict-shaped events, the common case over gRPC JSON."""
+    content = event.get("content")
+    if content:
+        parts = content.get("parts") if isinstance(content, dict) else _get_field(content, "parts")
+        if parts:
+            yield from parts
+
+    result = event.get("result")
+    if not result:
+        return
+
+    response = _get_field(result, "response")
+    if response:
+        for candidate in _get_field(response, "candidates") or ():
+            candidate_content = _get_field(candidate, "content")
+            if not candidate_content:
+                continue
+            yield from _get_field(candidate_content, "parts") or ()
+
+        output_text = _get_field(response, "output_text")
+        if output_text:
+            if isinstance(output_text, (list, tuple)):
+                for text_value in output_text:
+                    yield {"text": text_value}
+            else:
+                yield {"text": output_text}
+
+    output = _get_field(result, "output")
+    if output:
+        yield from _get_field(output, "parts") or ()
+        text_value = _get_field(output, "text")
+        if text_value:
+            yield {"text": text_value}
+
+
 def _iter_parts_from_event(event: Any) -> Iterable[Any]:
+    if isinstance(event, dict):
+        yield from _fast_parts(event)
+        return
+
     content = _get_field(event, "content")
     if content:
-        parts = _get_field(content, "parts", [])
+        parts = _get_field(content, "parts")
         if parts:
-            for part in parts:
-                yield part
+            yield from parts
 
     result = _get_field(event, "result")
     if not result:
@@ -290,12 +415,11 @@ def _iter_parts_from_event(event: Any) -> Iterable[Any]:
 
     response = _get_field(result, "response")
     if response:
-        for candidate in _get_field(response, "candidates", []) or []:
+        for candidate in _get_field(response, "candidates") or ():
             candidate_content = _get_field(candidate, "content")
             if not candidate_content:
                 continue
-            for part in _get_field(candidate_content, "parts", []) or []:
-                yield part
+            yield from _get_field(candidate_content, "parts") or ()
 
         output_text = _get_field(response, "output_text")
         if output_text:
@@ -307,20 +431,108 @@ def _iter_parts_from_event(event: Any) -> Iterable[Any]:
 
     output = _get_field(result, "output")
     if output:
-        for part in _get_field(output, "parts", []) or []:
-            yield part
+        yield from _get_field(output, "parts") or ()
         text_value = _get_field(output, "text")
         if text_value:
             yield {"text": text_value}
 
 
+class _PartialJSONWatcher:
+    """Incremental brace/string tracker over a growing streamed text.
+
+    Each call to :meth:`feed` scans only the characters added since the last
+    call, so deciding whether the stream contains a complete JSON object stays
+    O(new characters) instead of re-scanning the whole candidate per event.
+    """
+
+    __slots__ = ("_pos", "_started", "_depth", "_in_string", "_escaped", "complete")
+
+    def __init__(self) -> None:
+        self._reset()
+
+    def _reset(self) -> None:
+        self._pos = 0
+        self._started = False
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self.complete = False
+
+    def feed(self, text: str) -> None:
+        if self.complete:
+            return
+        index = self._pos
+        length = len(text)
+        if length < index:
+            # The candidate shrank (new message part); start over.
+            self._reset()
+            index = 0
+        while index < length:
+            char = text[index]
+            if not self._started:
+                if char == "{":
+                    self._started = True
+                    self._depth = 1
+            elif self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self.complete = True
+                    index += 1
+                    break
+            index += 1
+        self._pos = index
+
+
+def _read_is_final(event: Any) -> bool:
+    return bool(_get_field(event, "is_final_response"))
+
+
+def _call_is_final(event: Any) -> bool:
+    method = _get_field(event, "is_final_response")
+    if not callable(method):
+        return bool(method)
+    try:
+        return bool(method())
+    except Exception:
+        return False
+
+
+_STREAM_END = object()
+
+
+def _drain_stream(events: "queue.Queue[Any]", user_id: str, session_id: str, query: str) -> None:
+    """Push stream events into ``events`` from a worker thread.
+
+    Running the blocking iterator off the script thread lets JSON extraction
+    and preview callbacks overlap with the wait for the next event.
+    """
+    try:
+        for event in _get_remote_app().stream_query(user_id=user_id, session_id=session_id, message=query):
+            events.put(event)
+    except BaseException as exc:  # surfaced on the main thread
+        events.put(exc)
+    finally:
+        events.put(_STREAM_END)
+
+
 def _format_payload(payload: Any) -> str:
     if isinstance(payload, bytes):
         return payload.decode(errors="replace")
     if isinstance(payload, str):
         return payload
     try:
-        return json.dumps(payload, ensure_ascii=False, indent=2)
+        return _dumps(payload)
     except (TypeError, ValueError):
         return str(payload)
 
@@ -335,8 +547,28 @@ def _stream_agent_query(
     final_text = ""
     query = message if message else " "
 
+    # Preview memoization: skip re-extracting segments when the streamed
+    # candidate is unchanged or has only grown by a few characters.
+    last_hash: Optional[int] = None
+    last_len = 0
+    last_preview: Optional[str] = None
+    json_watcher = _PartialJSONWatcher()
+
+    # Bound once per stream: events keep one shape, so probe the first one
+    # instead of re-running callable() on every event.
+    is_final_extractor: Optional[Callable[[Any], bool]] = None
+
+    events: "queue.Queue[Any]" = queue.Queue()
+    threading.Thread(target=_drain_stream, args=(events, user_id, session_id, query), daemon=True).start()
+
     try:
-        for event in remote_app.stream_query(user_id=user_id, session_id=session_id, message=query):
+        while True:
+            event = events.get()
+            if event is _STREAM_END:
+                break
+            if isinstance(event, BaseException):
+                raise event
+
             text_parts: List[str] = []
             for part in _iter_parts_from_event(event):
                 function_call = _get_field(part, "function_call")
@@ -371,9 +603,25 @@ def _stream_agent_query(
                 candidate = "".join(text_parts).strip()
                 if candidate:
                     final_text = candidate
-                    preview_segments, preview_text = _extract_structured_segments(candidate)
-                    preview_sections = _sections_from_segments(preview_segments)
-                    preview = preview_text or _summarize_sections(preview_sections) or candidate
+                    candidate_hash = hash(candidate)
+                    # 縮んだ場合は新しいメッセージが始まったので必ず作り直す
+                    if last_preview is not None and (
+                        candidate_hash == last_hash or 0 <= len(candidate) - last_len < 64
+                    ):
+                        preview = last_preview
+                    else:
+                        json_watcher.feed(candidate)
+                        if json_watcher.complete:
+                            preview_segments, preview_text = _extract_structured_segments(candidate)
+                            preview_sections = _sections_from_segments(preview_segments)
+                            preview = preview_text or _summarize_sections(preview_sections) or candidate
+                        else:
+                            # No balanced JSON object yet: render the raw text
+                            # without attempting a parse.
+                            preview = candidate
+                        last_hash = candidate_hash
+                        last_len = len(candidate)
+                        last_preview = preview
                     if on_text_update:
                         on_text_update(preview)
 
@@ -383,13 +631,10 @@ def _stream_agent_query(
                 if on_text_update:
                     on_text_update(final_text)
 
-            is_final = _get_field(event, "is_final_response")
-            if callable(is_final):
-                try:
-                    is_final = is_final()
-                except Exception:
-                    is_final = False
-            if is_final:
+            if is_final_extractor is None:
+                probe = _get_field(event, "is_final_response")
+                is_final_extractor = _call_is_final if callable(probe) else _read_is_final
+            if is_final_extractor(event):
                 break
     except Exception as exc:
         print(f"Error in _stream_agent_query: {exc}")
@@ -424,16 +669,13 @@ def _get_session_id(session: Any) -> str:
 
 
 def _ensure_agent_session() -> tuple[str, str]:
-    if "agent_engine_user_id" not in st.session_state:
-        st.session_state.agent_engine_user_id = str(uuid.uuid4())
-
-    if "agent_engine_session_id" not in st.session_state:
-        user_id = st.session_state.agent_engine_user_id
-        session = remote_app.create_session(user_id=user_id)
-        st.session_state.agent_engine_session = session
-        st.session_state.agent_engine_session_id = _get_session_id(session)
-
-    return st.session_state.agent_engine_user_id, st.session_state.agent_engine_session_id
+    ids = st.session_state.get("agent_engine_ids")
+    if ids is None:
+        user_id = uuid.uuid4().hex
+        session = _get_remote_app().create_session(user_id=user_id)
+        ids = (user_id, _get_session_id(session))
+        st.session_state["agent_engine_ids"] = ids
+    return ids
 
 
 def _send_message(
@@ -450,13 +692,16 @@ def _format_price(entry: Dict[str, Any]) -> str:
     if price:
         return str(price)
     extracted = entry.get("extracted_price")
+    if isinstance(extracted, (int, float)):
+        return f"¥{extracted:,.0f}"
+    if isinstance(extracted, str):
+        try:
+            return f"¥{float(extracted):,.0f}"
+        except ValueError:
+            return extracted
     if extracted is None:
         return "価格情報なし"
-    try:
-        number = float(extracted)
-        return f"¥{number:,.0f}"
-    except (TypeError, ValueError):
-        return str(extracted)
+    return str(extracted)
 
 
 def _rating_from_position(position: Optional[int]) -> float:
@@ -466,66 +711,76 @@ def _rating_from_position(position: Optional[int]) -> float:
     return max(3.0, min(5.0, rating))
 
 
+_STAR_TABLE = tuple("★" * full + "☆" * (5 - full) for full in range(6))
+
+
 def _rating_to_stars(rating: float) -> str:
-    rounded = int(round(rating))
-    full = max(0, min(5, rounded))
-    empty = 5 - full
-    return "★" * full + "☆" * empty
+    return _STAR_TABLE[max(0, min(5, int(round(rating))))]
 
 
 def _extract_non_section_text(text: str) -> str:
     if not text:
         return ""
-    section_heading = re.compile(r"(^|\n)###\s+", re.MULTILINE)
-    match = section_heading.search(text)
+    match = _SECTION_HEADING_RE.search(text)
     if not match:
         return text.strip()
     return text[: match.start()].strip()
 
 
+_FALLBACK_CARD_IMAGE = "https://images.unsplash.com/photo-1707944145479-12755f0434d8?q=80&w=2237&auto=format&fit=crop"
+
+_CARD_TEMPLATE = (
+    "<div class='product-card'><div class='product-card-body'>"
+    "<img src='{image}' alt='{title}' loading='lazy' decoding='async'/>"
+    "<div class='product-card-title'>{title}</div>"
+    "<div class='product-card-price'>{price}</div>"
+    "<div class='product-card-rating'>{rating}</div>"
+    "{reason_html}{description_html}{meta_html}"
+    "</div></div>"
+)
+
+
 def _build_product_card(entry: Dict[str, Any]) -> str:
-    title = escape(entry.get("title") or "名称不明")
-    price = escape(_format_price(entry))
-    rating = _rating_to_stars(_rating_from_position(entry.get("position")))
-    image_url = (
-        entry.get("thumbnail")
-        or "https://images.unsplash.com/photo-1707944145479-12755f0434d8?q=80&w=2237&auto=format&fit=crop"
+    title = entry.get("title")
+    position = entry.get("position")
+    thumbnail = entry.get("thumbnail")
+    reason = entry.get("reason")
+    description = entry.get("description")
+    shipping = entry.get("shipping")
+    price_text = _format_price(entry)
+
+    # Escape every user-controlled string in one pass; \x1f never occurs in
+    # product data, so it is a safe join/split delimiter.
+    raw = (
+        str(title or "名称不明"),
+        price_text,
+        str(thumbnail or _FALLBACK_CARD_IMAGE),
+        str(reason or ""),
+        str(description or ""),
+        str(shipping or ""),
     )
-    image = escape(image_url)
-
-    meta_lines = []
-    if shipping := entry.get("shipping"):
-        meta_lines.append(escape(str(shipping)))
-    meta_html = "<div class='product-card-meta'>" + "<br/>".join(meta_lines) + "</div>" if meta_lines else ""
-
-    reason_html = ""
-    if reason := entry.get("reason"):
-        reason_html = f"<div class='product-card-reason'>{escape(reason)}</div>"
-
-    description_html = ""
-    if description := entry.get("description"):
-        description_html = f"<div class='product-card-meta'>{escape(description)}</div>"
-
-    body_html = (
-        "<div class='product-card-body'>"
-        f"<img src='{image}' alt='{title}'/>"
-        f"<div class='product-card-title'>{title}</div>"
-        f"<div class='product-card-price'>{price}</div>"
-        f"<div class='product-card-rating'>{rating}</div>"
-        f"{reason_html}"
-        f"{description_html}"
-        f"{meta_html}"
-        "</div>"
+    title_esc, price_esc, image_esc, reason_esc, description_esc, shipping_esc = str(escape("\x1f".join(raw))).split(
+        "\x1f"
     )
 
-    return f"<div class='product-card'>{body_html}</div>"
+    return _CARD_TEMPLATE.format_map(
+        {
+            "title": title_esc,
+            "price": price_esc,
+            "rating": _rating_to_stars(_rating_from_position(position)),
+            "image": image_esc,
+            "reason_html": f"<div class='product-card-reason'>{reason_esc}</div>" if reason else "",
+            "description_html": f"<div class='product-card-meta'>{description_esc}</div>" if description else "",
+            "meta_html": f"<div class='product-card-meta'>{shipping_esc}</div>" if shipping else "",
+        }
+    )
 
 
 def _stringify_struct(value: Any) -> str:
     if isinstance(value, str):
         return value
     try:
-        return json.dumps(value, ensure_ascii=False, indent=2)
+        return _dumps(value)
     except (TypeError, ValueError):
         return str(value)
 
@@ -538,21 +793,60 @@ def _ensure_list(value: Any) -> List[Any]:
     return [value]
 
 
+def _decode_str_escapes(value: str) -> str:
+    if "\\u" not in value:
+        return value
+    try:
+        return value.encode("utf-8").decode("unicode_escape")
+    except UnicodeDecodeError:
+        return value
+
+
 def _decode_unicode_escapes(value: Any) -> Any:
     if isinstance(value, str):
-        if "\\u" in value:
-            try:
-                return value.encode("utf-8").decode("unicode_escape")
-            except UnicodeDecodeError:
-                return value
+        return _decode_str_escapes(value)
+    if not isinstance(value, (list, dict)):
         return value
-    if isinstance(value, list):
-        return [_decode_unicode_escapes(item) for item in value]
-    if isinstance(value, dict):
-        return {key: _decode_unicode_escapes(val) for key, val in value.items()}
+    # The payload is freshly parsed and unshared, so mutate containers in
+    # place with an explicit stack rather than recursing per node.
+    stack: List[Any] = [value]
+    while stack:
+        container = stack.pop()
+        items = enumerate(container) if isinstance(container, list) else list(container.items())
+        for key, item in items:
+            if isinstance(item, str):
+                container[key] = _decode_str_escapes(item)
+            elif isinstance(item, (list, dict)):
+                stack.append(item)
     return value
 
 
+def _balanced_json_slice(text: str, start: int) -> Optional[str]:
+    """Return the first balanced {...} starting at ``start``, or None."""
+    depth = 0
+    in_string = False
+    escaped = False
+    for index in range(start, len(text)):
+        char = text[index]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char == '"':
+            in_string = True
+        elif char in "{[":
+            depth += 1
+        elif char in "}]":
+            depth -= 1
+            if depth == 0:
+                return text[start : index + 1]
+    return None
+
+
 def _extract_json_payload(raw_text: str) -> Optional[str]:
     if not raw_text:
         return None
@@ -560,71 +854,75 @@ def _extract_json_payload(raw_text: str) -> Optional[str]:
     trimmed = raw_text.strip()
 
     if trimmed.startswith("```"):
-        trimmed = trimmed[3:]
-        if trimmed.lower().startswith("json"):
-            trimmed = trimmed[4:]
-        trimmed = trimmed.strip()
-        if trimmed.endswith("```"):
-            trimmed = trimmed[:-3]
-        trimmed = trimmed.strip()
+        fence_match = _FENCED_JSON_RE.match(trimmed)
+        if fence_match:
+            trimmed = fence_match.group(1)
 
-    try:
-        json.loads(trimmed)
-        return trimmed
-    except (TypeError, ValueError):
-        pass
-
-    start = trimmed.find("{")
-    end = trimmed.rfind("}")
-    if start != -1 and end != -1 and end > start:
-        candidate = trimmed[start : end + 1]
+    if trimmed[:1] in "{[":
         try:
-            json.loads(candidate)
-            return candidate
+            json.loads(trimmed)
+            return trimmed
         except (TypeError, ValueError):
-            return None
+            pass
 
-    return None
+    start = trimmed.find("{")
+    if start == -1:
+        return None
+
+    candidate = _balanced_json_slice(trimmed, start)
+    if candidate is None:
+        return None
+    try:
+        json.loads(candidate)
+        return candidate
+    except (TypeError, ValueError):
+        return None
 
 
 def _flatten_segments(payload: Any) -> List[Dict[str, Any]]:
     segments: List[Dict[str, Any]] = []
+    stack: deque = deque((payload,))
 
-    if isinstance(payload, list):
-        for item in payload:
-            segments.extend(_flatten_segments(item))
-        return segments
-
-    if isinstance(payload, dict):
-        if isinstance(payload.get("segments"), list):
-            for item in payload["segments"]:
-                segments.extend(_flatten_segments(item))
-            return segments
-
-        if "type" in payload:
-            segment: Dict[str, Any] = {"type": str(payload.get("type"))}
-            if "content" in payload:
-                segment["content"] = payload["content"]
-            text_value = payload.get("text")
-            if text_value is not None:
-                segment["text"] = text_value
-                if "content" not in segment:
-                    segment["content"] = text_value
-            if "section" in payload:
-                segment["section"] = payload["section"]
-            for meta_key in ("title", "summary", "label", "id", "metadata"):
-                if meta_key in payload:
-                    segment[meta_key] = payload[meta_key]
-            segments.append(segment)
-            return segments
-
-        segments.append({"type": "object", "content": payload})
-        return segments
-
-    if payload is None:
-        return []
+    while stack:
+        item = stack.popleft()
+
+        if item is None:
+            continue
+
+        if isinstance(item, list):
+            # Re-queue at the front (reversed) so document order is preserved.
+            stack.extendleft(reversed(item))
+            continue
+
+        if isinstance(item, dict):
+            if isinstance(item.get("segments"), list):
+                stack.extendleft(reversed(item["segments"]))
+                continue
+
+            if "type" in item:
+                type_text = str(item.get("type"))
+                segment: Dict[str, Any] = {"type": type_text, "_type": type_text.lower()}
+                if "content" in item:
+                    segment["content"] = item["content"]
+                text_value = item.get("text")
+                if text_value is not None:
+                    segment["text"] = text_value
+                    if "content" not in segment:
+                        segment["content"] = text_value
+                if "section" in item:
+                    segment["section"] = item["section"]
+                for meta_key in ("title", "summary", "label", "id", "metadata"):
+                    if meta_key in item:
+                        segment[meta_key] = item[meta_key]
+                segments.append(segment)
+                continue
+
+            segments.append({"type": "object", "_type": "object", "content": item})
+            continue
 
-    return [{"type": "text", "content": payload}]
+        segments.append({"type": "text", "_type": "text", "content": item})
+
+    return segments
 
 
 def _extract_structured_segments(raw_text: str) -> Tuple[List[Dict[str, Any]], str]:
@@ -646,18 +944,82 @@ def _extract_structured_segments(raw_text: str) -> Tuple[List[Dict[str, Any]], s
 
     text_parts: List[str] = []
     for segment in segments:
-        if segment.get("type") == "text":
+        if segment.get("_type") == "text":
             text_field = segment.get("text")
             if isinstance(text_field, str) and text_field.strip():
                 text_parts.append(text_field)
                 continue
-        if segment.get("type") == "text" and isinstance(segment.get("content"), str):
-            text_parts.append(segment["content"])
+            if isinstance(segment.get("content"), str):
+                text_parts.append(segment["content"])
 
     display_text = "\n\n".join(part.strip() for part in text_parts if part) if text_parts else ""
     return segments, display_text.strip()
 
 
+# Key tuples used when resolving card fields out of parsed markdown items.
+_TITLE_KEYS = ("title", "name", "label", "商品名")
+_PRICE_KEYS = ("price", "price_text", "price_display", "price_range", "おおよその価格", "価格", "approx_price", "cost")
+_EXTRACTED_PRICE_KEYS = ("extracted_price", "price_value", "price_value_raw", "price_number", "price_numeric")
+_THUMB_KEYS = ("thumbnail", "image", "image_url", "画像URL", "画像リンク", "thumbnail_url")
+_LINK_KEYS = ("product_link", "url", "link", "productUrl", "商品ページURL", "購入リンク", "purchase_url")
+_SERPAPI_KEYS = ("serpapi_product_api", "serpapi", "SerpApi", "商品ID", "serpapi_product_id")
+_REASON_KEYS = ("reason", "推薦理由", "justification", "why")
+_DESCRIPTION_KEYS = ("description", "詳細", "補足", "notes")
+_SHIPPING_KEYS = ("shipping", "送料情報", "delivery")
+
+# Segment types recognized by the section and render dispatchers.
+_SECTION_TYPES = frozenset({"product_section", "card_section", "section"})
+_SECTION_LIST_TYPES = frozenset({"section_list"})
+_CARD_TYPES = frozenset({"cards", "card"})
+_STRUCTURED_TYPES = _SECTION_TYPES | _SECTION_LIST_TYPES | _CARD_TYPES
+_TEXT_TYPES = frozenset({"text", "message"})
+_DIVIDER_TYPES = frozenset({"divider", "separator"})
+_NOTICE_RENDERERS: Dict[str, Callable[[str], Any]] = {
+    "info": st.info,
+    "warning": st.warning,
+    "success": st.success,
+}
+_OBJECT_TYPES = frozenset({"object", "json"})
+
+# Card field -> candidate source keys, in priority order. The frozenset lets
+# _normalize_card_entry skip fields whose keys are absent without scanning.
+_CARD_FIELD_MAP: Tuple[Tuple[str, Tuple[str, ...], frozenset], ...] = tuple(
+    (field, keys, frozenset(keys))
+    for field, keys in (
+        ("title", ("title", "name", "商品名", "label")),
+        (
+            "price",
+            (
+                "price",
+                "price_text",
+                "price_display",
+                "price_range",
+                "おおよその価格",
+                "価格",
+                "approx_price",
+                "cost",
+            ),
+        ),
+        (
+            "extracted_price",
+            (
+                "extracted_price",
+                "price_value",
+                "price_value_raw",
+                "price_number",
+                "price_numeric",
+            ),
+        ),
+        ("product_link", ("product_link", "url", "商品ページURL", "購入リンク", "link")),
+        ("thumbnail", ("thumbnail", "image", "image_url", "画像URL", "画像リンク", "thumbnail_url")),
+        ("serpapi_product_api", ("serpapi_product_api", "serpapi", "商品ID", "SerpApi", "serpapi_product_id")),
+        ("reason", ("reason", "推薦理由", "justification")),
+        ("description", ("description", "詳細", "補足", "notes")),
+        ("shipping", ("shipping", "送料情報")),
+    )
+)
+
+
 def _first_non_empty(
     data: Dict[str, Any],
     keys: Tuple[str, ...],
@@ -673,67 +1035,60 @@ def _first_non_empty(
     return None
 
 
-def _normalize_card_entry(card_data: Dict[str, Any], position: int) -> Dict[str, Any]:
-    fields = card_data.get("fields") if isinstance(card_data.get("fields"), dict) else {}
+def _coalesce(
+    merged: Dict[str, Any],
+    keys: Tuple[str, ...],
+    default: Optional[Any] = None,
+) -> Any:
+    """Resolve a card field from a merged item/fields dict, unwrapping link shapes."""
+    value = None
+    for key in keys:
+        candidate = merged.get(key)
+        if candidate not in (None, ""):
+            value = candidate
+            break
+
+    if isinstance(value, (list, tuple)):
+        resolved = None
+        for candidate in value:
+            if isinstance(candidate, str) and candidate.strip():
+                resolved = candidate
+                break
+            if isinstance(candidate, dict):
+                for link_key in ("url", "link", "href"):
+                    link_value = candidate.get(link_key)
+                    if isinstance(link_value, str) and link_value.strip():
+                        resolved = link_value
+                        break
+                if resolved:
+                    break
+        value = resolved
 
-    entry: Dict[str, Any] = {}
-    entry["title"] = (
-        _first_non_empty(
-            card_data,
-            ("title", "name", "商品名", "label"),
-            fields,
-        )
-        or f"候補 {position}"
-    )
+    if isinstance(value, dict):
+        for link_key in ("url", "link", "href", "text"):
+            link_value = value.get(link_key)
+            if isinstance(link_value, str) and link_value.strip():
+                value = link_value
+                break
 
-    entry["price"] = _first_non_empty(
-        card_data,
-        (
-            "price",
-            "price_text",
-            "price_display",
-            "price_range",
-            "おおよその価格",
-            "価格",
-            "approx_price",
-            "cost",
-        ),
-        fields,
-    )
+    if value in (None, ""):
+        return default
+    return value
 
-    entry["extracted_price"] = _first_non_empty(
-        card_data,
-        (
-            "extracted_price",
-            "price_value",
-            "price_value_raw",
-            "price_number",
-            "price_numeric",
-        ),
-        fields,
-    )
 
-    entry["product_link"] = _first_non_empty(
-        card_data,
-        ("product_link", "url", "商品ページURL", "購入リンク", "link"),
-        fields,
-    )
+def _normalize_card_entry(card_data: Dict[str, Any], position: int) -> Dict[str, Any]:
+    fields = card_data.get("fields") if isinstance(card_data.get("fields"), dict) else {}
 
-    entry["thumbnail"] = _first_non_empty(
-        card_data,
-        ("thumbnail", "image", "image_url", "画像URL", "画像リンク", "thumbnail_url"),
-        fields,
-    )
+    present = card_data.keys() | fields.keys() if fields else card_data.keys()
 
-    entry["serpapi_product_api"] = _first_non_empty(
-        card_data,
-        ("serpapi_product_api", "serpapi", "商品ID", "SerpApi", "serpapi_product_id"),
-        fields,
-    )
+    entry: Dict[str, Any] = {}
+    for field, keys, key_set in _CARD_FIELD_MAP:
+        if key_set.isdisjoint(present):
+            continue
+        entry[field] = _first_non_empty(card_data, keys, fields)
 
-    entry["reason"] = _first_non_empty(card_data, ("reason", "推薦理由", "justification"), fields)
-    entry["description"] = _first_non_empty(card_data, ("description", "詳細", "補足", "notes"), fields)
-    entry["shipping"] = _first_non_empty(card_data, ("shipping", "送料情報"), fields)
+    if not entry.get("title"):
+        entry["title"] = f"候補 {position}"
 
     if not entry.get("product_link"):
         cta = card_data.get("cta") or card_data.get("button")
@@ -791,7 +1146,7 @@ def _sections_from_segments(segments: List[Dict[str, Any]]) -> List[Dict[str, An
     sections: List[Dict[str, Any]] = []
 
     for segment in segments:
-        seg_type = str(segment.get("type") or "").lower()
+        seg_type = segment.get("_type") or ""
         section_payload = segment.get("section")
         content = segment.get("content")
 
@@ -801,17 +1156,17 @@ def _sections_from_segments(segments: List[Dict[str, Any]]) -> List[Dict[str, An
                 sections.append(normalized)
             continue
 
-        if seg_type in {"product_section", "card_section", "section"} and isinstance(content, dict):
+        if seg_type in _SECTION_TYPES and isinstance(content, dict):
             normalized = _normalize_section(content, default_title=segment.get("title", ""))
             if normalized["items"]:
                 sections.append(normalized)
-        elif seg_type in {"section_list"} and isinstance(content, list):
+        elif seg_type in _SECTION_LIST_TYPES and isinstance(content, list):
             for entry in content:
                 if isinstance(entry, dict):
                     normalized = _normalize_section(entry)
                     if normalized["items"]:
                         sections.append(normalized)
-        elif seg_type in {"cards", "card"}:
+        elif seg_type in _CARD_TYPES:
             cards_list = content if isinstance(content, list) else [content]
             normalized_cards: List[Dict[str, Any]] = []
             for idx, card in enumerate(cards_list, start=1):
@@ -844,14 +1199,14 @@ def _render_structured_segments(
     segments: List[Dict[str, Any]],
 ) -> None:
     for segment in segments:
-        seg_type = str(segment.get("type") or "").lower()
+        seg_type = segment.get("_type") or ""
         content = segment.get("content")
         text_value = segment.get("text") if isinstance(segment.get("text"), str) else None
 
-        if seg_type in {"product_section", "card_section", "cards", "card", "section", "section_list"}:
+        if seg_type in _STRUCTURED_TYPES:
             continue
 
-        if seg_type in {"text", "message"}:
+        if seg_type in _TEXT_TYPES:
             display_text = text_value or (content if isinstance(content, str) else _stringify_struct(content))
             if display_text:
                 st.markdown(display_text)
@@ -861,20 +1216,15 @@ def _render_structured_segments(
         elif seg_type == "html":
             html_value = text_value or (content if isinstance(content, str) else _stringify_struct(content))
             st.markdown(html_value, unsafe_allow_html=True)
-        elif seg_type in {"divider", "separator"}:
+        elif seg_type in _DIVIDER_TYPES:
             st.divider()
         elif seg_type == "code":
             language = segment.get("language") or "text"
             st.code(content if isinstance(content, str) else _stringify_struct(content), language=language)
-        elif seg_type in {"info", "warning", "success"}:
+        elif seg_type in _NOTICE_RENDERERS:
             text_value = content if isinstance(content, str) else _stringify_struct(content)
-            if seg_type == "info":
-                st.info(text_value)
-            elif seg_type == "warning":
-                st.warning(text_value)
-            else:
-                st.success(text_value)
-        elif seg_type in {"object", "json"}:
+            _NOTICE_RENDERERS[seg_type](text_value)
+        elif seg_type in _OBJECT_TYPES:
             st.code(_stringify_struct(content), language="json")
         else:
             fallback = text_value or _stringify_struct(content)
@@ -887,6 +1237,65 @@ def _queue_related_query(prompt: str) -> None:
     st.session_state.scroll_to_bottom = True
 
 
+@st.cache_resource(show_spinner=False)
+def _http_session() -> requests.Session:
+    """Return the pooled SerpApi session, surviving script reruns."""
+    session = requests.Session()
+    session.mount(
+        "https://",
+        HTTPAdapter(
+            pool_connections=10,
+            pool_maxsize=20,
+            max_retries=Retry(total=2, backoff_factor=0.3, status_forcelist=[502, 503, 504]),
+        ),
+    )
+    return session
+
+
+def _project_product_payload(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Keep only the fields the sidebar renders from a detail payload."""
+    product = data.get("product_results") or {}
+    projected_product = {key: product[key] for key in ("title", "rating", "reviews", "description") if key in product}
+    prices = product.get("prices")
+    if prices:
+        projected_product["prices"] = prices[:3]
+    media = product.get("media")
+    if media:
+        projected_product["media"] = media[:1]
+
+    sellers = (data.get("sellers_results") or {}).get("online_sellers") or []
+    projected_sellers = []
+    for seller in sellers[:5]:
+        entry = {key: seller[key] for key in ("name", "total_price", "direct_link") if key in seller}
+        details = seller.get("details_and_offers")
+        if details:
+            entry["details_and_offers"] = details[:2]
+        projected_sellers.append(entry)
+
+    projected: Dict[str, Any] = {}
+    if projected_product:
+        projected["product_results"] = projected_product
+    if projected_sellers:
+        projected["sellers_results"] = {"online_sellers": projected_sellers}
+    return projected
+
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def _fetch_product_details_cached(serpapi_url: str) -> Optional[Dict[str, Any]]:
+    # URLにapi_keyパラメータを追加（キャッシュキーにはキーを含めない）
+    separator = "&" if "?" in serpapi_url else "?"
+    url_with_key = f"{serpapi_url}{separator}api_key={SERPAPI_KEY}"
+
+    response = _http_session().get(url_with_key, timeout=10)
+    response.raise_for_status()
+    data = _project_product_payload(_loads(response.content))
+    # One scan of the raw bytes; if no \\u escapes exist anywhere, skip
+    # walking the (projected) payload entirely.
+    if b"\\u" not in response.content:
+        return data
+    return _decode_unicode_escapes(data)
+
+
 def _fetch_product_details(serpapi_url: str) -> Optional[Dict[str, Any]]:
     """Fetch product details from SerpApi."""
     if not SERPAPI_KEY:
@@ -894,18 +1303,12 @@ def _fetch_product_details(serpapi_url: str) -> Optional[Dict[str, Any]]:
         return None
 
     try:
-        # URLにapi_keyパラメータを追加
-        separator = "&" if "?" in serpapi_url else "?"
-        url_with_key = f"{serpapi_url}{separator}api_key={SERPAPI_KEY}"
-
-        response = requests.get(url_with_key, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        return _decode_unicode_escapes(data)
+        return _fetch_product_details_cached(serpapi_url)
     except requests.exceptions.RequestException as e:
         st.error(f"商品詳細の取得に失敗しました: {e}")
         return None
-    except json.JSONDecodeError as e:
+    except ValueError as e:
+        # orjson と json のデコードエラーはどちらも ValueError 派生
         st.error(f"レスポンスの解析に失敗しました: {e}")
         return None
 
@@ -945,7 +1348,7 @@ def _display_product_details_sidebar(product_data: Dict[str, Any]) -> None:
             st.sidebar.markdown(
                 f"""
                 <div class="sidebar-product-image">
-                    <img src="{image_url}" alt="商品画像" style="width: 100%; height: auto; object-fit: contain;">
+                    <img src="{image_url}" alt="商品画像" loading="lazy" decoding="async" style="width: 100%; height: auto; object-fit: contain;">
                 </div>
                 """,
                 unsafe_allow_html=True,
@@ -983,6 +1386,18 @@ def _display_product_details_sidebar(product_data: Dict[str, Any]) -> None:
             st.sidebar.markdown("---")
 
 
+def _render_sidebar() -> None:
+    """Render the sidebar: detail view when loaded, usage hint otherwise."""
+    if st.session_state.get("loading_product_details", False):
+        st.sidebar.markdown("## 🔄 商品詳細を読み込み中...")
+        st.sidebar.markdown("少々お待ちください...")
+    elif st.session_state.get("product_details_data"):
+        _display_product_details_sidebar(st.session_state.product_details_data)
+    else:
+        st.sidebar.markdown("## 💡 使い方")
+        st.sidebar.markdown("商品カードの「詳しく見る」ボタンを押すと、詳細情報がここに表示されます。")
+
+
 def _handle_product_detail_click(serpapi_url: str, product_title: str) -> None:
     """Handle product detail button click."""
     # セッション状態に商品詳細データを保存
@@ -1004,30 +1419,17 @@ def _handle_product_detail_click(serpapi_url: str, product_title: str) -> None:
 
 
 def _parse_agent_sections(text: str) -> List[Dict[str, Any]]:
-    section_pattern = re.compile(r"^###\s+(.*)")
-    item_pattern = re.compile(r"^(\d+)\.\s*(.*)")
-    field_pattern = re.compile(r"^-\s*([^:：]+)[：:]+\s*(.*)")
-
     sections: List[Dict[str, Any]] = []
     current_section: Optional[Dict[str, Any]] = None
     current_item: Optional[Dict[str, Any]] = None
     last_field: Optional[str] = None
 
-    for raw_line in text.splitlines():
-        line = raw_line.rstrip()
-        stripped = line.strip()
-        if not stripped:
-            continue
-
-        section_match = section_pattern.match(stripped)
-        if section_match:
+    for match in _LINE_RE.finditer(text):
+        if match.group("section") is not None:
             if current_section:
-                if current_item:
-                    current_item = None
-                    last_field = None
                 sections.append(current_section)
             current_section = {
-                "title": section_match.group(1).strip(),
+                "title": match.group("s_title").strip(),
                 "summary_lines": [],
                 "items": [],
             }
@@ -1038,28 +1440,26 @@ def _parse_agent_sections(text: str) -> List[Dict[str, Any]]:
         if current_section is None:
             continue
 
-        item_match = item_pattern.match(stripped)
-        if item_match:
+        if match.group("item") is not None:
             current_item = {
-                "title": item_match.group(2).strip(),
+                "title": match.group("i_title").strip(),
                 "fields": {},
             }
             current_section["items"].append(current_item)
             last_field = None
             continue
 
-        field_match = field_pattern.match(stripped)
-        if field_match and current_item is not None:
-            label = field_match.group(1).strip()
-            value = field_match.group(2).strip()
-            current_item["fields"][label] = value
+        if match.group("field") is not None and current_item is not None:
+            label = match.group("f_label").strip()
+            # Values are accumulated as line lists and joined once at the end.
+            current_item["fields"][label] = [match.group("f_val").strip()]
             last_field = label
             continue
 
         if current_item is not None and last_field:
-            current_item["fields"][last_field] = (current_item["fields"].get(last_field, "") + "\n" + stripped).strip()
+            current_item["fields"][last_field].append(match.group(0).strip())
         elif current_item is None:
-            current_section["summary_lines"].append(line)
+            current_section["summary_lines"].append(match.group(0).rstrip())
 
     if current_section:
         sections.append(current_section)
@@ -1067,6 +1467,8 @@ def _parse_agent_sections(text: str) -> List[Dict[str, Any]]:
     for section in sections:
         section["summary"] = "\n".join(section.get("summary_lines", [])).strip()
         section.pop("summary_lines", None)
+        for item in section["items"]:
+            item["fields"] = {label: "\n".join(lines).strip() for label, lines in item["fields"].items()}
 
     return sections
 
@@ -1077,21 +1479,31 @@ def _render_shopping_sections(
     sections: Optional[List[Dict[str, Any]]] = None,
 ) -> bool:
     if sections is None:
-        sections = _parse_agent_sections(message.get("content", ""))
+        content = message.get("content", "")
+        # Section parsing only applies to responses with "###" headings;
+        # skip the regex scan entirely for plain answers.
+        if "###" not in content:
+            message.setdefault("sections", [])
+            return False
+        sections = _parse_agent_sections(content)
     if not sections:
         return False
 
-    queries: List[str] = []
-    for log in message.get("tool_logs", []):
-        if log.get("name") != "shopping_search" or log.get("type") != "response":
-            continue
-        try:
-            payload = json.loads(log.get("payload", "{}"))
-        except json.JSONDecodeError:
-            continue
-        query = payload.get("query")
-        if query:
-            queries.append(query)
+    queries = message.get("_queries_cache")
+    if queries is None:
+        queries = []
+        for log in message.get("tool_logs", []):
+            if log.get("name") != "shopping_search" or log.get("type") != "response":
+                continue
+            try:
+                payload = _loads(log.get("payload", "{}").encode())
+            except ValueError:
+                continue
+            query = payload.get("query")
+            if query:
+                queries.append(query)
+        # Tool logs are immutable once the turn finishes, so parse them once.
+        message["_queries_cache"] = queries
 
     for section_index, section in enumerate(sections):
         items = section.get("items", [])
@@ -1108,12 +1520,12 @@ def _render_shopping_sections(
             header_cols = st.columns([0.75, 0.25])
             with header_cols[0]:
                 st.markdown(
-                    f"<div class='product-section-title'>{escape(title)}</div>",
+                    f"<div class='product-section-title'>{_esc(title)}</div>",
                     unsafe_allow_html=True,
                 )
                 if summary:
                     st.markdown(
-                        f"<div class='product-section-summary'>{escape(summary)}</div>",
+                        f"<div class='product-section-summary'>{_esc(summary)}</div>",
                         unsafe_allow_html=True,
                     )
 
@@ -1129,97 +1541,34 @@ def _render_shopping_sections(
                     args=(f"{prompt_query}に関連する商品を探してください。",),
                 )
 
+        # Sections are immutable once the message lands, so the normalized
+        # entries are cached per section and reruns only re-emit HTML.
+        entry_cache: Dict[int, List[Dict[str, Any]]] = message.setdefault("_card_entries_by_section", {})
+        cached_entries = entry_cache.get(section_index)
+        if cached_entries is not None:
+            _emit_card_entries(message_index, section_index, cached_entries)
+            continue
+
         card_entries: List[Dict[str, Any]] = []
         for item_index, item in enumerate(items, start=1):
             fields = item.get("fields") if isinstance(item.get("fields"), dict) else {}
 
-            def _coalesce(keys: Tuple[str, ...], default: Optional[Any] = None) -> Any:
-                value = _first_non_empty(item, keys, fields)
-
-                if isinstance(value, (list, tuple)):
-                    resolved = None
-                    for candidate in value:
-                        if isinstance(candidate, str) and candidate.strip():
-                            resolved = candidate
-                            break
-                        if isinstance(candidate, dict):
-                            for link_key in ("url", "link", "href"):
-                                link_value = candidate.get(link_key)
-                                if isinstance(link_value, str) and link_value.strip():
-                                    resolved = link_value
-                                    break
-                            if resolved:
-                                break
-                    value = resolved
-
-                if isinstance(value, dict):
-                    for link_key in ("url", "link", "href", "text"):
-                        link_value = value.get(link_key)
-                        if isinstance(link_value, str) and link_value.strip():
-                            value = link_value
-                            break
-
-                if value in (None, ""):
-                    return default
-                return value
+            # Merge once per item so each field resolves with single dict probes;
+            # non-empty item entries take precedence over parsed fields.
+            merged: Dict[str, Any] = dict(fields)
+            merged.update((key, value) for key, value in item.items() if value not in (None, ""))
 
             entry: Dict[str, Any] = {
-                "title": _coalesce(("title", "name", "label", "商品名"), f"候補 {item_index}"),
-                "price": _coalesce(
-                    (
-                        "price",
-                        "price_text",
-                        "price_display",
-                        "price_range",
-                        "おおよその価格",
-                        "価格",
-                        "approx_price",
-                        "cost",
-                    )
-                ),
-                "extracted_price": _coalesce(
-                    (
-                        "extracted_price",
-                        "price_value",
-                        "price_value_raw",
-                        "price_number",
-                        "price_numeric",
-                    )
-                ),
+                "title": _coalesce(merged, _TITLE_KEYS, f"候補 {item_index}"),
+                "price": _coalesce(merged, _PRICE_KEYS),
+                "extracted_price": _coalesce(merged, _EXTRACTED_PRICE_KEYS),
                 "position": item.get("position") or item_index,
-                "thumbnail": _coalesce(
-                    (
-                        "thumbnail",
-                        "image",
-                        "image_url",
-                        "画像URL",
-                        "画像リンク",
-                        "thumbnail_url",
-                    )
-                ),
-                "product_link": _coalesce(
-                    (
-                        "product_link",
-                        "url",
-                        "link",
-                        "productUrl",
-                        "商品ページURL",
-                        "購入リンク",
-                        "purchase_url",
-                    )
-                ),
-                "serpapi_product_api": _coalesce(
-                    (
-                        "serpapi_product_api",
-                        "serpapi",
-                        "SerpApi",
-                        "商品ID",
-                        "serpapi_product_id",
-                    )
-                ),
-                "reason": _coalesce(("reason", "推薦理由", "justification", "why")),
-                "description": _coalesce(("description", "詳細", "補足", "notes")),
-                "shipping": _coalesce(("shipping", "送料情報", "delivery")),
+                "thumbnail": _coalesce(merged, _THUMB_KEYS),
+                "product_link": _coalesce(merged, _LINK_KEYS),
+                "serpapi_product_api": _coalesce(merged, _SERPAPI_KEYS),
+                "reason": _coalesce(merged, _REASON_KEYS),
+                "description": _coalesce(merged, _DESCRIPTION_KEYS),
+                "shipping": _coalesce(merged, _SHIPPING_KEYS),
             }
 
             if not entry.get("product_link"):
@@ -1265,40 +1614,47 @@ def _render_shopping_sections(
 
             card_entries.append(entry)
 
-        # 商品カードとボタンを同じカラム内に表示
-        cards_per_row = 3
-        for start in range(0, len(card_entries), cards_per_row):
-            row_entries = card_entries[start : start + cards_per_row]
-            cols = st.columns(cards_per_row)
-            for offset, entry in enumerate(row_entries):
-                card_position = start + offset
-                with cols[offset]:
-                    card_html = _build_product_card(entry)
-                    st.markdown(card_html, unsafe_allow_html=True)
-                    st.markdown("<div style='height:12px;'></div>", unsafe_allow_html=True)
-
-                    serpapi_url = entry.get("serpapi_product_api")
-                    product_link = entry.get("product_link")
-                    button_key = f"detail_{message_index}_{section_index}_{card_position}"
-
-                    if serpapi_url:
-                        if st.button(
-                            "詳しく見る",
-                            key=button_key,
-                            type="secondary",
-                            use_container_width=True,
-                        ):
-                            _handle_product_detail_click(serpapi_url, entry.get("title", "商品"))
-                    elif product_link:
-                        st.markdown(
-                            f"<a class='product-card-button' href='{escape(product_link)}' target='_blank' rel='noopener'>商品ページ</a>",
-                            unsafe_allow_html=True,
-                        )
-            st.markdown("</div>", unsafe_allow_html=True)
+        entry_cache[section_index] = card_entries
+        _emit_card_entries(message_index, section_index, card_entries)
 
     return True
 
 
+def _emit_card_entries(message_index: int, section_index: int, card_entries: List[Dict[str, Any]]) -> None:
+    # 全カードを1つのCSSグリッドとして描画し、カラムコンテナを作らない
+    grid_cells: List[str] = []
+    detail_entries: List[Tuple[int, Dict[str, Any]]] = []
+    for card_position, entry in enumerate(card_entries):
+        cell_html = _build_product_card(entry)
+        serpapi_url = entry.get("serpapi_product_api")
+        product_link = entry.get("product_link")
+        if serpapi_url:
+            detail_entries.append((card_position, entry))
+        elif product_link:
+            cell_html += (
+                f"<a class='product-card-button' href='{_esc(product_link)}' "
+                "target='_blank' rel='noopener'>商品ページ</a>"
+            )
+        grid_cells.append(f"<div>{cell_html}</div>")
+    st.markdown("<div class='card-grid'>" + "".join(grid_cells) + "</div>", unsafe_allow_html=True)
+
+    # 「詳しく見る」だけはウィジェットが必要なので、セクションごとに1行だけ並べる
+    if detail_entries:
+        cols = st.columns(len(detail_entries))
+        for col, (card_position, entry) in zip(cols, detail_entries):
+            with col:
+                button_key = f"detail_{message_index}_{section_index}_{card_position}"
+                if st.button(
+                    f"詳しく見る #{card_position + 1}",
+                    key=button_key,
+                    type="secondary",
+                    use_container_width=True,
+                ):
+                    _handle_product_detail_click(
+                        entry.get("serpapi_product_api"), entry.get("title", "商品")
+                    )
+
+
 def _initialize_conversation(user_id: str, session_id: str) -> None:
     if st.session_state.get("initialized"):
         return
@@ -1316,7 +1672,7 @@ def _initialize_conversation(user_id: str, session_id: str) -> None:
         }
 
     display_text = initial_response.get("display_text", "")
-    if (not display_text) or ("エラー" in display_text) or ("SERPAPI" in display_text):
+    if not display_text or _INIT_SKIP_RE.search(display_text):
         display_text = "その人の職業や年齢、Xのリンクなどを教えてください。誕生日プレゼント選びをお手伝いします。"
         initial_response["segments"] = []
         initial_response["sections"] = []
@@ -1335,8 +1691,14 @@ def _initialize_conversation(user_id: str, session_id: str) -> None:
     st.session_state.initialized = True
 
 
+def _show_tool_logs(flag_key: str) -> None:
+    st.session_state[flag_key] = True
+
+
 def _render_messages() -> None:
-    for index, message in enumerate(st.session_state.get("messages", [])):
+    messages = st.session_state.get("messages", [])
+    last_index = len(messages) - 1
+    for index, message in enumerate(messages):
         with st.chat_message(message["role"]):
             if message["role"] == "assistant":
                 segments: List[Dict[str, Any]] = message.get("segments", []) or []
@@ -1350,19 +1712,44 @@ def _render_messages() -> None:
                         _render_shopping_sections(index, message, rendered_sections)
                 else:
                     content = message.get("content", "")
-                    sections = _parse_agent_sections(content)
+                    # Message content is immutable once appended, so the parse
+                    # result is cached on the dict and keyed by content length.
+                    if message.get("_sections_cached_for") == len(content):
+                        sections = message.get("sections") or []
+                    else:
+                        sections = _parse_agent_sections(content)
+                        message["sections"] = sections
+                        message["_sections_cached_for"] = len(content)
                     text_to_render = _extract_non_section_text(content) if sections else content
                     if text_to_render:
                         st.markdown(text_to_render)
                     if sections:
-                        message.setdefault("sections", sections)
                         _render_shopping_sections(index, message, sections)
             else:
                 st.markdown(message.get("content", ""))
-            for log in message.get("tool_logs", []):
-                label = "ツール呼び出し" if log["type"] == "call" else "ツール応答"
-                with st.expander(f"{label}: {log['name']}", expanded=False):
-                    st.code(log["payload"], language="json")
+            logs = message.get("tool_logs", [])
+            if logs:
+                # 直近メッセージ以外はボタンを押すまでペイロードを描画しない
+                flag_key = f"logs_open_{index}"
+                with st.expander(f"ツール呼び出し履歴 ({len(logs)})", expanded=False):
+                    if index == last_index or st.session_state.get(flag_key):
+                        for log in logs:
+                            label = "ツール呼び出し" if log["type"] == "call" else "ツール応答"
+                            st.caption(f"{label}: {log['name']}")
+                            payload = log["payload"]
+                            if len(payload) > _MAX_LOG_PAYLOAD_CHARS:
+                                payload = payload[:_MAX_LOG_PAYLOAD_CHARS] + "\n…(省略)"
+                            st.code(payload, language="json")
+                    else:
+                        st.button(
+                            "履歴を表示",
+                            key=f"logs_show_{index}",
+                            on_click=_show_tool_logs,
+                            args=(flag_key,),
+                        )
+
+    # 最下部アンカー。scroll_to_bottom 時にここへスクロールする。
+    st.markdown("<div id='chat-bottom'></div>", unsafe_allow_html=True)
 
 
 def _handle_user_turn(user_id: str, session_id: str, text: str) -> None:
@@ -1385,7 +1772,6 @@ def _handle_user_turn(user_id: str, session_id: str, text: str) -> None:
                 )
         except Exception as error:
             st.error(f"エラーが発生しました: {error}")
-            preview_placeholder.markdown("申し訳ありません、処理中にエラーが発生しました。もう一度お試しください。")
             response_data = {
                 "raw_text": "",
                 "display_text": "申し訳ありません、処理中にエラーが発生しました。もう一度お試しください。",
@@ -1394,7 +1780,10 @@ def _handle_user_turn(user_id: str, session_id: str, text: str) -> None:
                 "tool_logs": [],
             }
 
-    preview_placeholder.markdown(response_data.get("display_text") or response_data.get("raw_text", ""))
+    # Don't render the final response inline: the st.rerun() below makes
+    # _render_messages the single render path for completed messages, so the
+    # placeholder only ever carries the transient streaming preview.
+    preview_placeholder.empty()
 
     st.session_state.messages.append(
         {
@@ -1431,29 +1820,15 @@ def main() -> None:
         _initialize_conversation(user_id, session_id)
 
     # サイドバーでローディング状態と商品詳細を表示
-    if st.session_state.get("loading_product_details", False):
-        st.sidebar.markdown("## 🔄 商品詳細を読み込み中...")
-        st.sidebar.markdown("少々お待ちください...")
-    elif st.session_state.get("product_details_data"):
-        _display_product_details_sidebar(st.session_state.product_details_data)
-    else:
-        st.sidebar.markdown("## 💡 使い方")
-        st.sidebar.markdown("商品カードの「詳しく見る」ボタンを押すと、詳細情報がここに表示されます。")
+    _render_sidebar()
 
     _render_messages()
 
     if st.session_state.pop("scroll_to_bottom", False):
+        # _render_messages が置いたアンカーへ1回だけスクロールする最小のiframe。
         components.html(
-            """
-            <script>
-            const mainSection = window.parent.document.querySelector('section.main');
-            if (mainSection) {
-                mainSection.scrollTo({ top: mainSection.scrollHeight, behavior: 'smooth' });
-            } else {
-                window.parent.scrollTo({ top: document.body.scrollHeight, behavior: 'smooth' });
-            }
-            </script>
-            """,
+            "<script>parent.document.getElementById('chat-bottom')"
+            "?.scrollIntoView({behavior:'smooth'})</script>",
             height=0,
         )
 
@@ -2,29 +2,47 @@
 
 from __future__ import annotations
 
-import asyncio
+import io
 import json
 import os
+import queue
 import re
+import threading
 import uuid
 import warnings
+from concurrent.futures import ThreadPoolExecutor
 from html import escape
 from pathlib import Path
-from typing import Any, Dict, Iterable, List, Optional
+from typing import Any, Callable, Dict, Iterable, List, Optional
 
 import requests
 import streamlit as st
 import streamlit.components.v1 as components
+from requests.adapters import HTTPAdapter, Retry
 import vertexai
 from dotenv import load_dotenv
 from google.oauth2 import service_account
 from vertexai import agent_engines
 
+try:
+    import orjson
+
+    def _dumps(payload: Any) -> str:
+        return orjson.dumps(payload, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS).decode()
+
+    def _loads(data: bytes) -> Any:
+        return orjson.loads(data)
+
+except ImportError:
+
+    def _dumps(payload: Any) -> str:
+        return json.dumps(payload, ensure_ascii=False, indent=2)
+
+    def _loads(data: bytes) -> Any:
+        return json.loads(data)
+
 # Pydantic の警告を抑制
 warnings.filterwarnings("ignore", message="Field name .* shadows an attribute in parent")
-# aiohttp の警告を抑制
-warnings.filterwarnings("ignore", message="Unclosed client session")
-warnings.filterwarnings("ignore", message="Unclosed connector")
 
 BASE_DIR = Path(__file__).resolve().parent
 
@@ -33,6 +51,12 @@ load_dotenv()
 
 SERPAPI_KEY = os.getenv("SERPAPI_API_KEY")
 
+# Compiled once per process; reruns happen on every widget interaction.
+_SECTION_RE = re.compile(r"^###\s+(.*)")
+_ITEM_RE = re.compile(r"^(\d+)\.\s*(.*)")
+_FIELD_RE = re.compile(r"^-\s*([^:：]+)[：:]+\s*(.*)")
+_SECTION_HEADING_RE = re.compile(r"(^|\n)###\s+", re.MULTILINE)
+
 AGENT_ENGINE_ID = os.getenv("VERTEX_AI_AGENT_ENGINE_ID")
 VERTEX_PROJECT = os.getenv("GOOGLE_CLOUD_PROJECT")
 VERTEX_LOCATION = os.getenv("GOOGLE_CLOUD_LOCATION")
@@ -52,14 +76,15 @@ vertex_kwargs: Dict[str, Any] = {
 if GOOGLE_APPLICATION_CREDENTIALS:
     vertex_kwargs["credentials"] = service_account.Credentials.from_service_account_file(GOOGLE_APPLICATION_CREDENTIALS)
 
-vertexai.init(**vertex_kwargs)
-remote_app = agent_engines.get(AGENT_ENGINE_ID)
 
+@st.cache_resource(show_spinner=False)
+def _get_remote_app() -> Any:
+    """Initialize Vertex AI lazily and share the Agent Engine handle."""
+    vertexai.init(**vertex_kwargs)
+    return agent_engines.get(AGENT_ENGINE_ID)
 
-def _inject_custom_styles() -> None:
-    """Inject CSS styles for custom card layout."""
-    st.markdown(
-        """
+
+_CUSTOM_CSS = """
         <style>
         :root {
             --primary-color: #518378;
@@ -222,9 +247,18 @@ def _inject_custom_styles() -> None:
             object-fit: contain;
         }
         </style>
-        """,
-        unsafe_allow_html=True,
-    )
+        """
+
+# 毎リランで送る文字列なので、先に1回だけ空白を潰しておく
+_CUSTOM_CSS_MIN = re.sub(r"\s+", " ", _CUSTOM_CSS).strip()
+
+
+def _inject_custom_styles() -> None:
+    """Inject CSS styles for custom card layout."""
+    # Streamlit drops elements that are not re-emitted on a rerun, so the
+    # style block has to go out every run; sending the pre-minified constant
+    # keeps the per-rerun cost to one small cached delta.
+    st.markdown(_CUSTOM_CSS_MIN, unsafe_allow_html=True)
 
 
 def _get_field(obj: Any, name: str, default: Any = None) -> Any:
@@ -233,13 +267,56 @@ def _get_field(obj: Any, name: str, default: Any = None) -> Any:
     return getattr(obj, name, default)
 
 
+def _fast_parts(event: Dict[str, Any]) -> Iterable[Any]:
+    """Part iteration for dict-shaped events, the common case over gRPC JSON."""
+    content = event.get("content")
+    if content:
+        parts = content.get("parts") if isinstance(content, dict) else _get_field(content, "parts")
+        if parts:
+            # content.parts is the dominant event shape; events carrying it
+            # don't also carry result/output payloads, so stop probing here.
+            yield from parts
+            return
+
+    result = event.get("result")
+    if not result:
+        return
+
+    response = _get_field(result, "response")
+    if response:
+        for candidate in _get_field(response, "candidates") or ():
+            candidate_content = _get_field(candidate, "content")
+            if not candidate_content:
+                continue
+            yield from _get_field(candidate_content, "parts") or ()
+
+        output_text = _get_field(response, "output_text")
+        if output_text:
+            if isinstance(output_text, (list, tuple)):
+                for text_value in output_text:
+                    yield {"text": text_value}
+            else:
+                yield {"text": output_text}
+
+    output = _get_field(result, "output")
+    if output:
+        yield from _get_field(output, "parts") or ()
+        text_value = _get_field(output, "text")
+        if text_value:
+            yield {"text": text_value}
+
+
 def _iter_parts_from_event(event: Any) -> Iterable[Any]:
+    if isinstance(event, dict):
+        yield from _fast_parts(event)
+        return
+
     content = _get_field(event, "content")
     if content:
-        parts = _get_field(content, "parts", [])
+        parts = _get_field(content, "parts")
         if parts:
-            for part in parts:
-                yield part
+            yield from parts
+            return
 
     result = _get_field(event, "result")
     if not result:
@@ -247,12 +324,11 @@ def _iter_parts_from_event(event: Any) -> Iterable[Any]:
 
     response = _get_field(result, "response")
     if response:
-        for candidate in _get_field(response, "candidates", []) or []:
+        for candidate in _get_field(response, "candidates") or ():
             candidate_content = _get_field(candidate, "content")
             if not candidate_content:
                 continue
-            for part in _get_field(candidate_content, "parts", []) or []:
-                yield part
+            yield from _get_field(candidate_content, "parts") or ()
 
         output_text = _get_field(response, "output_text")
         if output_text:
@@ -264,8 +340,7 @@ def _iter_parts_from_event(event: Any) -> Iterable[Any]:
 
     output = _get_field(result, "output")
     if output:
-        for part in _get_field(output, "parts", []) or []:
-            yield part
+        yield from _get_field(output, "parts") or ()
         text_value = _get_field(output, "text")
         if text_value:
             yield {"text": text_value}
@@ -277,19 +352,48 @@ def _format_payload(payload: Any) -> str:
     if isinstance(payload, str):
         return payload
     try:
-        return json.dumps(payload, ensure_ascii=False, indent=2)
+        return _dumps(payload)
     except (TypeError, ValueError):
         return str(payload)
 
 
-def _stream_agent_query(user_id: str, session_id: str, message: str) -> tuple[str, List[Dict[str, Any]]]:
+# stream_query has no async variant in this SDK, so a background thread reads
+# the network stream into a queue and the consumer loop processes events
+# concurrently with the next read.
+_STREAM_END = object()
+
+
+def _drain_stream(events: "queue.Queue[Any]", user_id: str, session_id: str, query: str) -> None:
+    try:
+        for event in _get_remote_app().stream_query(user_id=user_id, session_id=session_id, message=query):
+            events.put(event)
+    except Exception as exc:
+        events.put(exc)
+    finally:
+        events.put(_STREAM_END)
+
+
+def _stream_agent_query(
+    user_id: str,
+    session_id: str,
+    message: str,
+    on_text_update: Optional[Callable[[str], None]] = None,
+) -> tuple[str, List[Dict[str, Any]]]:
     tool_logs: List[Dict[str, Any]] = []
     final_text = ""
     query = message if message else " "
 
+    events: "queue.Queue[Any]" = queue.Queue()
+    threading.Thread(target=_drain_stream, args=(events, user_id, session_id, query), daemon=True).start()
+
     try:
-        for event in remote_app.stream_query(user_id=user_id, session_id=session_id, message=query):
-            text_parts: List[str] = []
+        while True:
+            event = events.get()
+            if event is _STREAM_END:
+                break
+            if isinstance(event, BaseException):
+                raise event
+            text_buf = io.StringIO()
             for part in _iter_parts_from_event(event):
                 function_call = _get_field(part, "function_call")
                 if function_call:
@@ -317,12 +421,13 @@ def _stream_agent_query(user_id: str, session_id: str, message: str) -> tuple[st
 
                 text_value = _get_field(part, "text")
                 if text_value:
-                    text_parts.append(text_value)
+                    text_buf.write(text_value)
 
-            if text_parts:
-                candidate = "".join(text_parts).strip()
-                if candidate:
-                    final_text = candidate
+            candidate = text_buf.getvalue().strip()
+            if candidate and candidate != final_text:
+                final_text = candidate
+                if on_text_update:
+                    on_text_update(candidate)
 
             error_message = _get_field(event, "error_message")
             if error_message:
@@ -356,21 +461,46 @@ def _get_session_id(session: Any) -> str:
     return session_id
 
 
+@st.cache_resource(show_spinner=False)
+def _session_store() -> Dict[str, str]:
+    """Process-wide user_id → Agent Engine session_id map shared across tabs."""
+    return {}
+
+
 def _ensure_agent_session() -> tuple[str, str]:
     if "agent_engine_user_id" not in st.session_state:
-        st.session_state.agent_engine_user_id = str(uuid.uuid4())
+        # リロードしても同じユーザーとして扱えるよう、IDをクエリに残す
+        user_id = st.query_params.get("uid") or str(uuid.uuid4())
+        st.query_params["uid"] = user_id
+        st.session_state.agent_engine_user_id = user_id
 
     if "agent_engine_session_id" not in st.session_state:
         user_id = st.session_state.agent_engine_user_id
-        session = remote_app.create_session(user_id=user_id)
-        st.session_state.agent_engine_session = session
-        st.session_state.agent_engine_session_id = _get_session_id(session)
+        store = _session_store()
+        session_id = store.get(user_id)
+        if session_id:
+            try:
+                _get_remote_app().get_session(user_id=user_id, session_id=session_id)
+            except Exception:
+                session_id = None
+        if not session_id:
+            session = _get_remote_app().create_session(user_id=user_id)
+            session_id = _get_session_id(session)
+            store[user_id] = session_id
+        st.session_state.agent_engine_session_id = session_id
 
     return st.session_state.agent_engine_user_id, st.session_state.agent_engine_session_id
 
 
-async def _send_message(user_id: str, session_id: str, text: str) -> tuple[str, List[Dict[str, Any]]]:
-    return await asyncio.to_thread(_stream_agent_query, user_id, session_id, text)
+def _send_message(
+    user_id: str,
+    session_id: str,
+    text: str,
+    on_text_update: Optional[Callable[[str], None]] = None,
+) -> tuple[str, List[Dict[str, Any]]]:
+    # The feeder thread in _stream_agent_query keeps network reads off this
+    # thread, so the consumer can run here and update Streamlit placeholders.
+    return _stream_agent_query(user_id, session_id, text, on_text_update=on_text_update)
 
 
 def _format_price(entry: Dict[str, Any]) -> str:
@@ -394,59 +524,66 @@ def _rating_from_position(position: Optional[int]) -> float:
     return max(3.0, min(5.0, rating))
 
 
+# ratings round to 6 possible strings; build them once
+_STAR_TABLE = tuple("★" * full + "☆" * (5 - full) for full in range(6))
+
+
 def _rating_to_stars(rating: float) -> str:
-    rounded = int(round(rating))
-    full = max(0, min(5, rounded))
-    empty = 5 - full
-    return "★" * full + "☆" * empty
+    return _STAR_TABLE[max(0, min(5, int(round(rating))))]
 
 
 def _extract_non_section_text(text: str) -> str:
     if not text:
         return ""
-    section_heading = re.compile(r"(^|\n)###\s+", re.MULTILINE)
-    match = section_heading.search(text)
+    match = _SECTION_HEADING_RE.search(text)
     if not match:
         return text.strip()
     return text[: match.start()].strip()
 
 
+_FALLBACK_CARD_IMAGE = "https://images.unsplash.com/photo-1707944145479-12755f0434d8?q=80&w=2237&auto=format&fit=crop"
+
+_CARD_TEMPLATE = (
+    "<div class='product-card'><div class='product-card-body'>"
+    "<img src='{image}' alt='{title}'/>"
+    "<div class='product-card-title'>{title}</div>"
+    "<div class='product-card-price'>{price}</div>"
+    "<div class='product-card-rating'>{rating}</div>"
+    "{reason_html}{description_html}{meta_html}"
+    "</div></div>"
+)
+
+
 def _build_product_card(entry: Dict[str, Any]) -> str:
-    title = escape(entry.get("title") or "名称不明")
-    price = escape(_format_price(entry))
-    rating = _rating_to_stars(_rating_from_position(entry.get("position")))
-    image_url = (
-        entry.get("thumbnail")
-        or "https://images.unsplash.com/photo-1707944145479-12755f0434d8?q=80&w=2237&auto=format&fit=crop"
-    )
-    image = escape(image_url)
-
-    meta_lines = []
-    if shipping := entry.get("shipping"):
-        meta_lines.append(escape(str(shipping)))
-    meta_html = "<div class='product-card-meta'>" + "<br/>".join(meta_lines) + "</div>" if meta_lines else ""
-
-    reason_html = ""
-    if reason := entry.get("reason"):
-        reason_html = f"<div class='product-card-reason'>{escape(reason)}</div>"
-
-    description_html = ""
-    if description := entry.get("description"):
-        description_html = f"<div class='product-card-meta'>{escape(description)}</div>"
-
-    body_html = (
-        "<div class='product-card-body'>"
-        f"<img src='{image}' alt='{title}'/>"
-        f"<div class='product-card-title'>{title}</div>"
-        f"<div class='product-card-price'>{price}</div>"
-        f"<div class='product-card-rating'>{rating}</div>"
-        f"{reason_html}"
-        f"{description_html}"
-        f"{meta_html}"
-        "</div>"
+    position = entry.get("position")
+    thumbnail = entry.get("thumbnail")
+    reason = entry.get("reason")
+    description = entry.get("description")
+    shipping = entry.get("shipping")
+
+    # Escape every user-controlled string in one pass; \x1f never occurs in
+    # product data, so it is a safe join/split delimiter.
+    raw = (
+        entry.get("title") or "名称不明",
+        _format_price(entry),
+        str(thumbnail or _FALLBACK_CARD_IMAGE),
+        str(reason or ""),
+        str(description or ""),
+        str(shipping or ""),
     )
+    title_esc, price_esc, image_esc, reason_esc, description_esc, shipping_esc = escape("\x1f".join(raw)).split("\x1f")
 
-    return f"<div class='product-card'>{body_html}</div>"
+    return _CARD_TEMPLATE.format_map(
+        {
+            "title": title_esc,
+            "price": price_esc,
+            "rating": _rating_to_stars(_rating_from_position(position)),
+            "image": image_esc,
+            "reason_html": f"<div class='product-card-reason'>{reason_esc}</div>" if reason else "",
+            "description_html": f"<div class='product-card-meta'>{description_esc}</div>" if description else "",
+            "meta_html": f"<div class='product-card-meta'>{shipping_esc}</div>" if shipping else "",
+        }
+    )
 
 
 def _queue_related_query(prompt: str) -> None:
@@ -454,6 +591,73 @@ def _queue_related_query(prompt: str) -> None:
     st.session_state.scroll_to_bottom = True
 
 
+@st.cache_resource(show_spinner=False)
+def _serpapi_session() -> requests.Session:
+    """Pooled HTTP session shared across Streamlit sessions for SerpApi calls."""
+    session = requests.Session()
+    session.mount(
+        "https://",
+        HTTPAdapter(
+            pool_connections=10,
+            pool_maxsize=20,
+            max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504]),
+        ),
+    )
+    session.headers.update({"User-Agent": "birthday-agent/1.0"})
+    return session
+
+
+@st.cache_data(ttl=900, max_entries=256, show_spinner=False)
+def _fetch_product_details_cached(serpapi_url: str, _api_key: str) -> Dict[str, Any]:
+    """Fetch and cache one SerpApi product payload, keyed on the URL only."""
+    # URLにapi_keyパラメータを追加
+    separator = "&" if "?" in serpapi_url else "?"
+    url_with_key = f"{serpapi_url}{separator}api_key={_api_key}"
+
+    response = _serpapi_session().get(url_with_key, timeout=(3.05, 10))
+    response.raise_for_status()
+    return response.json()
+
+
+_PREFETCH_LIMIT = 6
+
+
+@st.cache_resource(show_spinner=False)
+def _prefetch_pool() -> ThreadPoolExecutor:
+    """Return the prefetch executor, surviving script reruns.
+
+    同時プリフェッチ数を絞って SerpApi のレート制限を避ける。
+    """
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix="detail-prefetch")
+
+
+def _warm_detail_cache(serpapi_url: str, api_key: str) -> None:
+    try:
+        _fetch_product_details_cached(serpapi_url, api_key)
+    except Exception:
+        pass  # クリック時に改めて取得してエラー表示する
+
+
+def _prefetch_product_details(sections: List[Dict[str, Any]]) -> None:
+    """Warm the detail cache for the first few cards during user think-time."""
+    if not SERPAPI_KEY:
+        return
+    urls: List[str] = []
+    for section in sections:
+        for item in section.get("items", []):
+            fields = item.get("fields", {})
+            url = fields.get("serpapi_product_api") or fields.get("SerpApi") or fields.get("商品ID")
+            if isinstance(url, str) and url.startswith("http") and url not in urls:
+                urls.append(url)
+                if len(urls) >= _PREFETCH_LIMIT:
+                    break
+        if len(urls) >= _PREFETCH_LIMIT:
+            break
+    pool = _prefetch_pool()
+    for url in urls:
+        pool.submit(_warm_detail_cache, url, SERPAPI_KEY)
+
+
 def _fetch_product_details(serpapi_url: str) -> Optional[Dict[str, Any]]:
     """Fetch product details from SerpApi."""
     if not SERPAPI_KEY:
@@ -461,13 +665,7 @@ def _fetch_product_details(serpapi_url: str) -> Optional[Dict[str, Any]]:
         return None
 
     try:
-        # URLにapi_keyパラメータを追加
-        separator = "&" if "?" in serpapi_url else "?"
-        url_with_key = f"{serpapi_url}{separator}api_key={SERPAPI_KEY}"
-
-        response = requests.get(url_with_key, timeout=10)
-        response.raise_for_status()
-        return response.json()
+        return _fetch_product_details_cached(serpapi_url, SERPAPI_KEY)
     except requests.exceptions.RequestException as e:
         st.error(f"商品詳細の取得に失敗しました: {e}")
         return None
@@ -562,62 +760,62 @@ def _handle_product_detail_click(serpapi_url: str, product_title: str) -> None:
 
 
 def _parse_agent_sections(text: str) -> List[Dict[str, Any]]:
-    section_pattern = re.compile(r"^###\s+(.*)")
-    item_pattern = re.compile(r"^(\d+)\.\s*(.*)")
-    field_pattern = re.compile(r"^-\s*([^:：]+)[：:]+\s*(.*)")
-
     sections: List[Dict[str, Any]] = []
     current_section: Optional[Dict[str, Any]] = None
     current_item: Optional[Dict[str, Any]] = None
     last_field: Optional[str] = None
 
     for raw_line in text.splitlines():
-        line = raw_line.rstrip()
-        stripped = line.strip()
+        stripped = raw_line.strip()
         if not stripped:
             continue
-
-        section_match = section_pattern.match(stripped)
-        if section_match:
-            if current_section:
-                if current_item:
-                    current_item = None
-                    last_field = None
-                sections.append(current_section)
-            current_section = {
-                "title": section_match.group(1).strip(),
-                "summary_lines": [],
-                "items": [],
-            }
-            current_item = None
-            last_field = None
-            continue
+        # 行頭1文字で行種別を判定し、必要な正規表現だけ走らせる
+        first = stripped[0]
+
+        if first == "#" and stripped.startswith("###"):
+            section_match = _SECTION_RE.match(stripped)
+            if section_match:
+                if current_section:
+                    if current_item:
+                        current_item = None
+                        last_field = None
+                    sections.append(current_section)
+                current_section = {
+                    "title": section_match.group(1).strip(),
+                    "summary_lines": [],
+                    "items": [],
+                }
+                current_item = None
+                last_field = None
+                continue
 
         if current_section is None:
             continue
 
-        item_match = item_pattern.match(stripped)
-        if item_match:
-            current_item = {
-                "title": item_match.group(2).strip(),
-                "fields": {},
-            }
-            current_section["items"].append(current_item)
-            last_field = None
-            continue
+        if first.isdigit():
+            item_match = _ITEM_RE.match(stripped)
+            if item_match:
+                current_item = {
+                    "title": item_match.group(2).strip(),
+                    "fields": {},
+                }
+                current_section["items"].append(current_item)
+                last_field = None
+                continue
 
-        field_match = field_pattern.match(stripped)
-        if field_match and current_item is not None:
-            label = field_match.group(1).strip()
-            value = field_match.group(2).strip()
-            current_item["fields"][label] = value
-            last_field = label
-            continue
+        if first == "-" and current_item is not None:
+            field_match = _FIELD_RE.match(stripped)
+            if field_match:
+                label = field_match.group(1).strip()
+                value = field_match.group(2).strip()
+                current_item["fields"][label] = value
+                last_field = label
+                continue
 
         if current_item is not None and last_field:
             current_item["fields"][last_field] = (current_item["fields"].get(last_field, "") + "\n" + stripped).strip()
         elif current_item is None:
-            current_section["summary_lines"].append(line)
+            current_section["summary_lines"].append(raw_line.rstrip())
 
     if current_section:
         sections.append(current_section)
@@ -644,8 +842,8 @@ def _render_shopping_sections(
         if log.get("name") != "shopping_search" or log.get("type") != "response":
             continue
         try:
-            payload = json.loads(log.get("payload", "{}"))
-        except json.JSONDecodeError:
+            payload = _loads(log.get("payload", "{}").encode())
+        except ValueError:
             continue
         query = payload.get("query")
         if query:
@@ -687,52 +885,63 @@ def _render_shopping_sections(
                     args=(f"{prompt_query}に関連する商品を探してください。",),
                 )
 
-            card_entries: List[Dict[str, Any]] = []
-            for item_index, item in enumerate(items, start=1):
-                fields = item.get("fields", {})
-                entry: Dict[str, Any] = {
-                    "title": item.get("title") or f"候補 {item_index}",
-                    "price": fields.get("おおよその価格") or fields.get("価格"),
-                    "position": item_index,
-                    "thumbnail": fields.get("画像URL") or fields.get("画像リンク"),
-                    "product_link": fields.get("商品ページURL") or fields.get("購入リンク"),
-                    "serpapi_product_api": fields.get("serpapi_product_api")
-                    or fields.get("SerpApi")
-                    or fields.get("商品ID"),
-                    "reason": fields.get("推薦理由"),
-                    "description": fields.get("詳細") or fields.get("補足"),
-                }
-                card_entries.append(entry)
-
-            # 商品カードとボタンを同じカラム内に表示
-            cards_per_row = 3
-            for start in range(0, len(card_entries), cards_per_row):
-                row_entries = card_entries[start : start + cards_per_row]
-                cols = st.columns(cards_per_row)
-                for offset, entry in enumerate(row_entries):
-                    card_position = start + offset
-                    with cols[offset]:
-                        card_html = _build_product_card(entry)
-                        st.markdown(card_html, unsafe_allow_html=True)
-                        st.markdown("<div style='height:12px;'></div>", unsafe_allow_html=True)
-
-                        serpapi_url = entry.get("serpapi_product_api")
-                        product_link = entry.get("product_link")
+            # セクション内容は不変なので、カードHTMLと詳細ボタン対象を
+            # メッセージに一度だけ組み立てて保存し、リランでは再利用する
+            prebuilt = message.setdefault("_prebuilt_cards", {})
+            cached = prebuilt.get(section_index)
+            if cached is None:
+                card_entries: List[Dict[str, Any]] = []
+                for item_index, item in enumerate(items, start=1):
+                    fields = item.get("fields", {})
+                    entry: Dict[str, Any] = {
+                        "title": item.get("title") or f"候補 {item_index}",
+                        "price": fields.get("おおよその価格") or fields.get("価格"),
+                        "position": item_index,
+                        "thumbnail": fields.get("画像URL") or fields.get("画像リンク"),
+                        "product_link": fields.get("商品ページURL") or fields.get("購入リンク"),
+                        "serpapi_product_api": fields.get("serpapi_product_api")
+                        or fields.get("SerpApi")
+                        or fields.get("商品ID"),
+                        "reason": fields.get("推薦理由"),
+                        "description": fields.get("詳細") or fields.get("補足"),
+                    }
+                    card_entries.append(entry)
+
+                # カードHTMLはセクション単位で1つのmarkdownにまとめて送る
+                card_html_parts: List[str] = ["<div class='product-card-row'>"]
+                detail_entries: List[tuple[int, Dict[str, Any]]] = []
+                for card_position, entry in enumerate(card_entries):
+                    card_html = _build_product_card(entry)
+                    serpapi_url = entry.get("serpapi_product_api")
+                    product_link = entry.get("product_link")
+                    if serpapi_url:
+                        detail_entries.append((card_position, entry))
+                    elif product_link:
+                        card_html += (
+                            f"<a class='product-card-button' href='{escape(product_link)}' "
+                            "target='_blank' rel='noopener'>商品ページ</a>"
+                        )
+                    card_html_parts.append(f"<div>{card_html}</div>")
+                card_html_parts.append("</div>")
+                cached = ("".join(card_html_parts), detail_entries)
+                prebuilt[section_index] = cached
+
+            row_html, detail_entries = cached
+            st.markdown(row_html, unsafe_allow_html=True)
+
+            # 「詳しく見る」はコールバックが必要なので st.button のまま並べる
+            if detail_entries:
+                cols = st.columns(len(detail_entries))
+                for col, (card_position, entry) in zip(cols, detail_entries):
+                    with col:
                         button_key = f"detail_{message_index}_{section_index}_{card_position}"
-
-                        if serpapi_url:
-                            if st.button(
-                                "詳しく見る",
-                                key=button_key,
-                                type="secondary",
-                                use_container_width=True,
-                            ):
-                                _handle_product_detail_click(serpapi_url, entry.get("title", "商品"))
-                        elif product_link:
-                            st.markdown(
-                                f"<a class='product-card-button' href='{escape(product_link)}' target='_blank' rel='noopener'>商品ページ</a>",
-                                unsafe_allow_html=True,
-                            )
+                        if st.button(
+                            "詳しく見る",
+                            key=button_key,
+                            type="secondary",
+                            use_container_width=True,
+                        ):
+                            _handle_product_detail_click(entry["serpapi_product_api"], entry.get("title", "商品"))
             st.markdown("</div>", unsafe_allow_html=True)
 
     return True
@@ -744,7 +953,7 @@ def _initialize_conversation(user_id: str, session_id: str) -> None:
 
     st.session_state.messages = []
     try:
-        initial_reply, tool_logs = asyncio.run(_send_message(user_id, session_id, ""))
+        initial_reply, tool_logs = _send_message(user_id, session_id, "")
     except Exception:
         initial_reply, tool_logs = "", []
     if (not initial_reply) or ("エラー" in initial_reply) or ("SERPAPI" in initial_reply):
@@ -760,13 +969,24 @@ def _initialize_conversation(user_id: str, session_id: str) -> None:
     st.session_state.initialized = True
 
 
+def _show_section_cards(flag_key: str) -> None:
+    st.session_state[flag_key] = True
+
+
 def _render_messages() -> None:
-    for index, message in enumerate(st.session_state.get("messages", [])):
+    messages = st.session_state.get("messages", [])
+    last_index = len(messages) - 1
+    for index, message in enumerate(messages):
         with st.chat_message(message["role"]):
             content = message.get("content", "")
             sections: List[Dict[str, Any]] = []
             if message["role"] == "assistant":
-                sections = _parse_agent_sections(content)
+                # Message content never changes once appended, so parse once
+                # and keep the result on the message dict.
+                sections = message.get("sections")
+                if sections is None:
+                    sections = _parse_agent_sections(content)
+                    message["sections"] = sections
                 text_to_render = _extract_non_section_text(content) if sections else content
             else:
                 text_to_render = content
@@ -774,8 +994,19 @@ def _render_messages() -> None:
             if text_to_render:
                 st.markdown(text_to_render)
 
-            if message["role"] == "assistant":
-                _render_shopping_sections(index, message, sections)
+            if message["role"] == "assistant" and sections:
+                # 直近2ターンだけカードを即描画し、古いターンはボタンを押す
+                # まで section/card ウィジェットを生成しない
+                flag_key = f"cards_open_{index}"
+                if index >= last_index - 1 or st.session_state.get(flag_key):
+                    _render_shopping_sections(index, message, sections)
+                else:
+                    st.button(
+                        "提案カードを表示",
+                        key=f"cards_show_{index}",
+                        on_click=_show_section_cards,
+                        args=(flag_key,),
+                    )
             for log in message.get("tool_logs", []):
                 label = "ツール呼び出し" if log["type"] == "call" else "ツール応答"
                 with st.expander(f"{label}: {log['name']}", expanded=False):
@@ -786,20 +1017,36 @@ def _handle_user_turn(user_id: str, session_id: str, text: str) -> None:
     if not text:
         return
     st.session_state.messages.append({"role": "user", "content": text})
-    with st.spinner("候補を考えています..."):
+    with st.chat_message("user"):
+        st.markdown(text)
+
+    with st.chat_message("assistant"):
+        preview_placeholder = st.empty()
         try:
-            reply, tool_logs = asyncio.run(_send_message(user_id, session_id, text))
+            with st.spinner("候補を考えています..."):
+                reply, tool_logs = _send_message(
+                    user_id,
+                    session_id,
+                    text,
+                    on_text_update=lambda preview: preview_placeholder.markdown(preview or ""),
+                )
         except Exception as error:
             st.error(f"エラーが発生しました: {error}")
             reply = "申し訳ありません、処理中にエラーが発生しました。もう一度お試しください。"
             tool_logs = []
+        preview_placeholder.empty()
+    content = reply or "申し訳ありません、返答を生成できませんでした。"
+    sections = _parse_agent_sections(content)
     st.session_state.messages.append(
         {
             "role": "assistant",
-            "content": reply or "申し訳ありません、返答を生成できませんでした。",
+            "content": content,
+            "sections": sections,
             "tool_logs": tool_logs,
         }
     )
+    # ユーザーが回答を読んでいる間に詳細データを温めておく
+    _prefetch_product_details(sections)
     st.rerun()
 
 
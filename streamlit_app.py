@@ -6,6 +6,7 @@ import asyncio
 import json
 import os
 import re
+import time
 import uuid
 import warnings
 from html import escape
@@ -14,6 +15,7 @@ from typing import Any, Callable, Dict, List, Optional, Tuple
 import requests
 import streamlit as st
 import streamlit.components.v1 as components
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
 from google.adk.runners import InMemoryRunner
 from google.genai.types import Part, UserContent
@@ -31,11 +33,15 @@ load_dotenv()
 APP_NAME = os.getenv("ADK_APP_NAME", "birthday-present-agent")
 SERPAPI_KEY = os.getenv("SERPAPI_API_KEY")
 
+# メッセージ描画のたびに呼ばれるので、パターンはプロセスで1回だけコンパイルする
+_SECTION_RE = re.compile(r"^###\s+(.*)")
+_ITEM_RE = re.compile(r"^(\d+)\.\s*(.*)")
+_FIELD_RE = re.compile(r"^-\s*([^:：]+)[：:]+\s*(.*)")
+# ストリーミング中のプレビュー再描画はこの間隔まで間引く(秒)
+_PREVIEW_MIN_INTERVAL = 0.08
 
-def _inject_custom_styles() -> None:
-    """Inject CSS styles for custom card layout."""
-    st.markdown(
-        """
+
+_CUSTOM_CSS = """
         <style>
         :root {
             --primary-color: #518378;
@@ -198,9 +204,18 @@ def _inject_custom_styles() -> None:
             object-fit: contain;
         }
         </style>
-        """,
-        unsafe_allow_html=True,
-    )
+        """
+
+# 毎リランで送る文字列なので、先に1回だけ空白を潰しておく
+_CUSTOM_CSS_MIN = re.sub(r"\s+", " ", _CUSTOM_CSS).strip()
+
+
+def _inject_custom_styles() -> None:
+    """Inject CSS styles for custom card layout."""
+    # Streamlit drops elements that are not re-emitted on a rerun, so the
+    # style block has to go out every run; sending the pre-minified constant
+    # keeps the per-rerun cost to one small cached delta.
+    st.markdown(_CUSTOM_CSS_MIN, unsafe_allow_html=True)
 
 
 async def _send_message(
@@ -213,8 +228,13 @@ async def _send_message(
 
     tool_logs: List[Dict[str, Any]] = []
     final_text = ""
+    last_emit = 0.0
+    pending_preview: Optional[str] = None
 
     user_content = UserContent(parts=[Part(text=text)])
+    # The streaming loop is the hottest path in the app; bind the append
+    # methods once instead of re-resolving them on every event.
+    log_tool = tool_logs.append
 
     try:
         async for event in runner.run_async(
@@ -227,52 +247,70 @@ async def _send_message(
                 continue
 
             text_parts: List[str] = []
+            add_text = text_parts.append
             for part in getattr(content, "parts", []) or []:
-                if getattr(part, "function_call", None):
-                    args = getattr(part.function_call, "args", {}) or {}
-                    tool_logs.append(
+                function_call = getattr(part, "function_call", None)
+                if function_call:
+                    args = getattr(function_call, "args", {}) or {}
+                    log_tool(
                         {
                             "type": "call",
-                            "name": part.function_call.name,
+                            "name": function_call.name,
                             "payload": json.dumps(args, ensure_ascii=False, indent=2),
                         }
                     )
-                elif getattr(part, "function_response", None):
-                    response_payload = getattr(part.function_response, "response", {}) or {}
+                    continue
+                function_response = getattr(part, "function_response", None)
+                if function_response:
+                    response_payload = getattr(function_response, "response", {}) or {}
                     if isinstance(response_payload, (str, bytes)):
                         payload_text = (
                             response_payload if isinstance(response_payload, str) else response_payload.decode()
                         )
                     else:
                         payload_text = json.dumps(response_payload, ensure_ascii=False, indent=2)
-                    tool_logs.append(
+                    log_tool(
                         {
                             "type": "response",
-                            "name": part.function_response.name,
+                            "name": function_response.name,
                             "payload": payload_text,
                         }
                     )
-                elif getattr(part, "text", None):
-                    text_parts.append(part.text)
+                    continue
+                part_text = getattr(part, "text", None)
+                if part_text:
+                    add_text(part_text)
 
             if text_parts:
                 candidate = "".join(text_parts).strip()
                 if candidate:
                     final_text = candidate
-                    preview_segments, preview_text = _extract_structured_segments(candidate)
-                    preview_sections = _sections_from_segments(preview_segments)
-                    preview = preview_text or _summarize_sections(preview_sections) or candidate
+                    # 途中経過はほぼ必ず不完全なJSON/Markdownなので、構造化
+                    # パースはストリーム完了後の1回に任せて生テキストを流す
+                    preview = candidate
                     if on_text_update:
-                        on_text_update(preview)
+                        # Streamlit再描画はイベントより桁違いに重いので間引く
+                        now = time.monotonic()
+                        if now - last_emit >= _PREVIEW_MIN_INTERVAL:
+                            on_text_update(preview)
+                            last_emit = now
+                            pending_preview = None
+                        else:
+                            pending_preview = preview
 
             if getattr(event, "error_message", None):
                 final_text = event.error_message
+                pending_preview = None
                 if on_text_update:
                     on_text_update(final_text)
 
             if hasattr(event, "is_final_response") and event.is_final_response():
                 break
 
+        # 間引きで飛ばした最後のプレビューは必ず出す
+        if pending_preview is not None and on_text_update:
+            on_text_update(pending_preview)
+
     except Exception as error:
         print(f"Error in _send_message: {error}")
         final_text = "エラーが発生しました。"
@@ -292,13 +330,31 @@ async def _send_message(
     }
 
 
+def _get_loop() -> asyncio.AbstractEventLoop:
+    """Return a per-session event loop, creating it on first use.
+
+    ``asyncio.run`` spins up and tears down a fresh loop (and its executor)
+    for every turn; reusing one loop keeps the runner's connections and
+    pending tasks alive across reruns.
+    """
+    loop = st.session_state.get("_loop")
+    if loop is None or loop.is_closed():
+        loop = asyncio.new_event_loop()
+        st.session_state["_loop"] = loop
+    return loop
+
+
+@st.cache_resource(show_spinner=False)
+def _get_runner() -> InMemoryRunner:
+    """Build the ADK runner once per process and share it across sessions."""
+    return InMemoryRunner(agent=root_agent, app_name=APP_NAME)
+
+
 def _ensure_runner_and_session() -> tuple[InMemoryRunner, Any]:
-    if "runner" not in st.session_state:
-        st.session_state.runner = InMemoryRunner(agent=root_agent, app_name=APP_NAME)
-    runner: InMemoryRunner = st.session_state.runner
+    runner = _get_runner()
 
     if "adk_session" not in st.session_state:
-        session = asyncio.run(
+        session = _get_loop().run_until_complete(
             runner.session_service.create_session(
                 app_name=APP_NAME,
                 user_id=str(uuid.uuid4()),
@@ -339,11 +395,17 @@ def _rating_to_stars(rating: float) -> str:
 def _extract_non_section_text(text: str) -> str:
     if not text:
         return ""
-    section_heading = re.compile(r"(^|\n)###\s+", re.MULTILINE)
-    match = section_heading.search(text)
-    if not match:
+    # _SECTION_RE (###\s+) と同じ見出し判定になるよう、スペース区切りと
+    # タブ区切りの両方を str.find で探す
+    if text.startswith(("### ", "###\t")):
+        return ""
+    idx = text.find("\n### ")
+    tab_idx = text.find("\n###\t")
+    if idx == -1 or (tab_idx != -1 and tab_idx < idx):
+        idx = tab_idx
+    if idx == -1:
         return text.strip()
-    return text[: match.start()].strip()
+    return text[:idx].strip()
 
 
 def _build_product_card(entry: Dict[str, Any]) -> str:
@@ -452,43 +514,48 @@ def _extract_json_payload(raw_text: str) -> Optional[str]:
 
 
 def _flatten_segments(payload: Any) -> List[Dict[str, Any]]:
+    # 再帰だと深い入れ子でフレーム生成コストが嵩むため、明示スタックで巡回する
     segments: List[Dict[str, Any]] = []
+    stack: List[Any] = [payload]
 
-    if isinstance(payload, list):
-        for item in payload:
-            segments.extend(_flatten_segments(item))
-        return segments
-
-    if isinstance(payload, dict):
-        if isinstance(payload.get("segments"), list):
-            for item in payload["segments"]:
-                segments.extend(_flatten_segments(item))
-            return segments
-
-        if "type" in payload:
-            segment: Dict[str, Any] = {"type": str(payload.get("type"))}
-            if "content" in payload:
-                segment["content"] = payload["content"]
-            text_value = payload.get("text")
-            if text_value is not None:
-                segment["text"] = text_value
-                if "content" not in segment:
-                    segment["content"] = text_value
-            if "section" in payload:
-                segment["section"] = payload["section"]
-            for meta_key in ("title", "summary", "label", "id", "metadata"):
-                if meta_key in payload:
-                    segment[meta_key] = payload[meta_key]
-            segments.append(segment)
-            return segments
-
-        segments.append({"type": "object", "content": payload})
-        return segments
-
-    if payload is None:
-        return []
+    while stack:
+        node = stack.pop()
 
-    return [{"type": "text", "content": payload}]
+        if isinstance(node, list):
+            stack.extend(reversed(node))
+            continue
+
+        if isinstance(node, dict):
+            if isinstance(node.get("segments"), list):
+                stack.extend(reversed(node["segments"]))
+                continue
+
+            if "type" in node:
+                segment: Dict[str, Any] = {"type": str(node.get("type"))}
+                if "content" in node:
+                    segment["content"] = node["content"]
+                text_value = node.get("text")
+                if text_value is not None:
+                    segment["text"] = text_value
+                    if "content" not in segment:
+                        segment["content"] = text_value
+                if "section" in node:
+                    segment["section"] = node["section"]
+                for meta_key in ("title", "summary", "label", "id", "metadata"):
+                    if meta_key in node:
+                        segment[meta_key] = node[meta_key]
+                segments.append(segment)
+                continue
+
+            segments.append({"type": "object", "content": node})
+            continue
+
+        if node is None:
+            continue
+
+        segments.append({"type": "text", "content": node})
+
+    return segments
 
 
 def _extract_structured_segments(raw_text: str) -> Tuple[List[Dict[str, Any]], str]:
@@ -537,67 +604,65 @@ def _first_non_empty(
     return None
 
 
+_FIELD_ALIASES: Dict[str, Tuple[str, ...]] = {
+    "title": ("title", "name", "商品名", "label"),
+    "price": (
+        "price",
+        "price_text",
+        "price_display",
+        "price_range",
+        "おおよその価格",
+        "価格",
+        "approx_price",
+        "cost",
+    ),
+    "extracted_price": (
+        "extracted_price",
+        "price_value",
+        "price_value_raw",
+        "price_number",
+        "price_numeric",
+    ),
+    "product_link": ("product_link", "url", "商品ページURL", "購入リンク", "link"),
+    "thumbnail": ("thumbnail", "image", "image_url", "画像URL", "画像リンク", "thumbnail_url"),
+    "serpapi_product_api": ("serpapi_product_api", "serpapi", "商品ID", "SerpApi", "serpapi_product_id"),
+    "reason": ("reason", "推薦理由", "justification"),
+    "description": ("description", "詳細", "補足", "notes"),
+    "shipping": ("shipping", "送料情報"),
+}
+
+# 別名 -> (正規フィールド名, タプル内の優先順位)。カード1枚ごとに全別名で
+# dictを引き直すのではなく、dict側を1回走査するだけで振り分けられる。
+_KEY_TO_FIELD: Dict[str, Tuple[str, int]] = {
+    alias: (field, rank)
+    for field, aliases in _FIELD_ALIASES.items()
+    for rank, alias in enumerate(aliases)
+}
+
+
 def _normalize_card_entry(card_data: Dict[str, Any], position: int) -> Dict[str, Any]:
     fields = card_data.get("fields") if isinstance(card_data.get("fields"), dict) else {}
 
     entry: Dict[str, Any] = {}
-    entry["title"] = (
-        _first_non_empty(
-            card_data,
-            ("title", "name", "商品名", "label"),
-            fields,
-        )
-        or f"候補 {position}"
-    )
-
-    entry["price"] = _first_non_empty(
-        card_data,
-        (
-            "price",
-            "price_text",
-            "price_display",
-            "price_range",
-            "おおよその価格",
-            "価格",
-            "approx_price",
-            "cost",
-        ),
-        fields,
-    )
-
-    entry["extracted_price"] = _first_non_empty(
-        card_data,
-        (
-            "extracted_price",
-            "price_value",
-            "price_value_raw",
-            "price_number",
-            "price_numeric",
-        ),
-        fields,
-    )
-
-    entry["product_link"] = _first_non_empty(
-        card_data,
-        ("product_link", "url", "商品ページURL", "購入リンク", "link"),
-        fields,
-    )
-
-    entry["thumbnail"] = _first_non_empty(
-        card_data,
-        ("thumbnail", "image", "image_url", "画像URL", "画像リンク", "thumbnail_url"),
-        fields,
-    )
-
-    entry["serpapi_product_api"] = _first_non_empty(
-        card_data,
-        ("serpapi_product_api", "serpapi", "商品ID", "SerpApi", "serpapi_product_id"),
-        fields,
-    )
+    best_rank: Dict[str, int] = {}
+    # card_data を先に走査し、そこで埋まったフィールドは fields では上書きしない
+    locked: frozenset = frozenset()
+    for source in (card_data, fields):
+        if not source:
+            continue
+        for key, value in source.items():
+            if value in (None, ""):
+                continue
+            hit = _KEY_TO_FIELD.get(key)
+            if hit is None or hit[0] in locked:
+                continue
+            field, rank = hit
+            if field not in best_rank or rank < best_rank[field]:
+                entry[field] = value
+                best_rank[field] = rank
+        locked = frozenset(best_rank)
 
-    entry["reason"] = _first_non_empty(card_data, ("reason", "推薦理由", "justification"), fields)
-    entry["description"] = _first_non_empty(card_data, ("description", "詳細", "補足", "notes"), fields)
-    entry["shipping"] = _first_non_empty(card_data, ("shipping", "送料情報"), fields)
+    entry.setdefault("title", f"候補 {position}")
 
     if not entry.get("product_link"):
         cta = card_data.get("cta") or card_data.get("button")
@@ -751,6 +816,25 @@ def _queue_related_query(prompt: str) -> None:
     st.session_state.scroll_to_bottom = True
 
 
+@st.cache_resource(show_spinner=False)
+def _serpapi_session() -> requests.Session:
+    """Return a pooled HTTP session shared by all SerpApi detail fetches."""
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+    return session
+
+
+@st.cache_data(ttl=600, show_spinner=False)
+def _fetch_product_details_cached(serpapi_url: str, _api_key: str) -> Dict[str, Any]:
+    """Fetch and decode a SerpApi product payload, cached per URL for 10 minutes."""
+    separator = "&" if "?" in serpapi_url else "?"
+    url_with_key = f"{serpapi_url}{separator}api_key={_api_key}"
+
+    response = _serpapi_session().get(url_with_key, timeout=10)
+    response.raise_for_status()
+    return _decode_unicode_escapes(response.json())
+
+
 def _fetch_product_details(serpapi_url: str) -> Optional[Dict[str, Any]]:
     """Fetch product details from SerpApi."""
     if not SERPAPI_KEY:
@@ -758,14 +842,7 @@ def _fetch_product_details(serpapi_url: str) -> Optional[Dict[str, Any]]:
         return None
 
     try:
-        # URLにapi_keyパラメータを追加
-        separator = "&" if "?" in serpapi_url else "?"
-        url_with_key = f"{serpapi_url}{separator}api_key={SERPAPI_KEY}"
-
-        response = requests.get(url_with_key, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        return _decode_unicode_escapes(data)
+        return _fetch_product_details_cached(serpapi_url, SERPAPI_KEY)
     except requests.exceptions.RequestException as e:
         st.error(f"商品詳細の取得に失敗しました: {e}")
         return None
@@ -868,10 +945,6 @@ def _handle_product_detail_click(serpapi_url: str, product_title: str) -> None:
 
 
 def _parse_agent_sections(text: str) -> List[Dict[str, Any]]:
-    section_pattern = re.compile(r"^###\s+(.*)")
-    item_pattern = re.compile(r"^(\d+)\.\s*(.*)")
-    field_pattern = re.compile(r"^-\s*([^:：]+)[：:]+\s*(.*)")
-
     sections: List[Dict[str, Any]] = []
     current_section: Optional[Dict[str, Any]] = None
     current_item: Optional[Dict[str, Any]] = None
@@ -883,7 +956,7 @@ def _parse_agent_sections(text: str) -> List[Dict[str, Any]]:
         if not stripped:
             continue
 
-        section_match = section_pattern.match(stripped)
+        section_match = _SECTION_RE.match(stripped)
         if section_match:
             if current_section:
                 if current_item:
@@ -902,7 +975,7 @@ def _parse_agent_sections(text: str) -> List[Dict[str, Any]]:
         if current_section is None:
             continue
 
-        item_match = item_pattern.match(stripped)
+        item_match = _ITEM_RE.match(stripped)
         if item_match:
             current_item = {
                 "title": item_match.group(2).strip(),
@@ -912,7 +985,7 @@ def _parse_agent_sections(text: str) -> List[Dict[str, Any]]:
             last_field = None
             continue
 
-        field_match = field_pattern.match(stripped)
+        field_match = _FIELD_RE.match(stripped)
         if field_match and current_item is not None:
             label = field_match.group(1).strip()
             value = field_match.group(2).strip()
@@ -1170,7 +1243,7 @@ def _initialize_conversation(runner: InMemoryRunner, session) -> None:
 
     st.session_state.messages = []
     try:
-        initial_response = asyncio.run(_send_message(runner, session, ""))
+        initial_response = _get_loop().run_until_complete(_send_message(runner, session, ""))
     except Exception:
         initial_response = {
             "raw_text": "",
@@ -1244,7 +1317,7 @@ def _handle_user_turn(runner: InMemoryRunner, session, text: str) -> None:
         preview_placeholder = st.empty()
         try:
             with st.spinner("候補を考えています..."):
-                response_data = asyncio.run(
+                response_data = _get_loop().run_until_complete(
                     _send_message(
                         runner,
                         session,